@@ -1,7 +1,6 @@
 import cv2
 import tkinter as tk
-from PIL import Image, ImageTk
-import numpy as np
+from preview_renderer import PreviewRenderer, GuideOverlay
 
 CAMERA_WIDTH = 1200
 CAMERA_HEIGHT = 2048
@@ -19,27 +18,6 @@ BORDER_HEIGHT_RATIO = 0.6
 BORDER_RADIUS = 30
 SHORT_LINE_LENGTH = 50
 
-def draw_rounded_corners_with_lines(image, p1, p2, color, thickness, r, line_length):
-    x1, y1 = p1
-    x2, y2 = p2
-
-    cv2.ellipse(image, (x1 + r, y1 + r), (r, r), 180, 0, 90, color, thickness)
-    cv2.ellipse(image, (x2 - r, y1 + r), (r, r), 270, 0, 90, color, thickness)
-    cv2.ellipse(image, (x1 + r, y2 - r), (r, r), 90, 0, 90, color, thickness)
-    cv2.ellipse(image, (x2 - r, y2 - r), (r, r), 0, 0, 90, color, thickness)
-
-    cv2.line(image, (x1 + r, y1), (x1 + r + line_length, y1), color, thickness)
-    cv2.line(image, (x2 - r, y1), (x2 - r - line_length, y1), color, thickness)
-
-    cv2.line(image, (x1 + r, y2), (x1 + r + line_length, y2), color, thickness)
-    cv2.line(image, (x2 - r, y2), (x2 - r - line_length, y2), color, thickness)
-
-    cv2.line(image, (x1, y1 + r), (x1, y1 + r + line_length), color, thickness)
-    cv2.line(image, (x1, y2 - r), (x1, y2 - r - line_length), color, thickness)
-
-    cv2.line(image, (x2, y1 + r), (x2, y1 + r + line_length), color, thickness)
-    cv2.line(image, (x2, y2 - r), (x2, y2 - r - line_length), color, thickness)
-
 cap = cv2.VideoCapture(CAMERA_INDEX)
 if not cap.isOpened():
     print(f"Error: Could not open camera with index {CAMERA_INDEX}. Please check connection or camera index.")
@@ -74,42 +52,13 @@ else:
 
 label_widget = tk.Label(window, bg="black")
 label_widget.pack(fill=tk.BOTH, expand=True)
+# The border guide is drawn once per display size and composited onto every frame
+renderer = PreviewRenderer(decorate=GuideOverlay(BORDER_COLOR, BORDER_THICKNESS, BORDER_RADIUS, SHORT_LINE_LENGTH,
+                                                 BORDER_WIDTH_RATIO, BORDER_HEIGHT_RATIO))
+
 def update_frame():
     ret, frame = cap.read()
     if ret:
-        frame = cv2.flip(frame, 1)
-
-        original_h, original_w, _ = frame.shape
-
-        target_aspect_ratio = TARGET_DISPLAY_WIDTH / TARGET_DISPLAY_HEIGHT
-        original_aspect_ratio = original_w / original_h
-
-        crop_x, crop_y, crop_w, crop_h = 0, 0, original_w, original_h
-
-        if original_aspect_ratio > target_aspect_ratio:
-            crop_w = int(original_h * target_aspect_ratio)
-            crop_x = (original_w - crop_w) // 2
-        else:
-            crop_h = int(original_w / target_aspect_ratio)
-            crop_y = (original_h - crop_h) // 2
-        
-        cropped_frame = frame[crop_y : crop_y + crop_h, crop_x : crop_x + crop_w]
-
-        border_w = int(cropped_frame.shape[1] * BORDER_WIDTH_RATIO)
-        border_h = int(cropped_frame.shape[0] * BORDER_HEIGHT_RATIO)
-
-        border_x1 = (cropped_frame.shape[1] - border_w) // 2
-        border_y1 = (cropped_frame.shape[0] - border_h) // 2
-        border_x2 = border_x1 + border_w
-        border_y2 = border_y1 + border_h
-
-        draw_rounded_corners_with_lines(cropped_frame, (border_x1, border_y1), (border_x2, border_y2),
-                                        BORDER_COLOR, BORDER_THICKNESS, BORDER_RADIUS, SHORT_LINE_LENGTH)
-
-        cv2_image = cv2.cvtColor(cropped_frame, cv2.COLOR_BGR2RGB)
-
-        pil_image = Image.fromarray(cv2_image)
-
         label_width = label_widget.winfo_width()
         label_height = label_widget.winfo_height()
 
@@ -117,18 +66,15 @@ def update_frame():
             label_width = TARGET_DISPLAY_WIDTH
             label_height = TARGET_DISPLAY_HEIGHT
 
-        pil_image = pil_image.resize((label_width, label_height), Image.LANCZOS)
-
-        tk_image = ImageTk.PhotoImage(pil_image)
-
-        label_widget.imgtk = tk_image
-        label_widget.config(image=tk_image)
+        # Crop, resize, mirror and border in preallocated buffers, then paste into the label's PhotoImage
+        renderer.show(label_widget, renderer.render(frame, (label_width, label_height)))
 
     label_widget.after(10, update_frame)
 
 update_frame()
 def on_closing():
     print("Closing application and releasing camera.")
+    print(f"Camera preview: {renderer.summary()}")
     cap.release()
     window.destroy()
 
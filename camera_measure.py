@@ -1,5 +1,21 @@
 import cv2
 import time
+import json
+import argparse
+from camera_pipeline import CAMERA_PROFILE_FILE, set_capture_size, fourcc_to_str
+
+# List of common resolutions to check
+COMMON_RESOLUTIONS = [
+    (640, 480),   # VGA
+    (800, 600),   # SVGA
+    (1024, 768),  # XGA
+    (1280, 720),  # HD 720p
+    (1920, 1080), # Full HD 1080p
+    (2560, 1440), # 2K (QHD)
+    (3840, 2160)  # 4K (UHD)
+]
+BENCHMARK_FOURCCS = ("MJPG", "YUYV")
+BENCHMARK_BUFFER_SIZES = (1, 2, 4)
 
 def measure_camera_resolution(camera_index=0):
     """
@@ -22,20 +38,9 @@ def measure_camera_resolution(camera_index=0):
     default_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     print(f"\nDefault camera resolution: {default_width}x{default_height}")
 
-    # List of common resolutions to check
-    common_resolutions = [
-        (640, 480),   # VGA
-        (800, 600),   # SVGA
-        (1024, 768),  # XGA
-        (1280, 720),  # HD 720p
-        (1920, 1080), # Full HD 1080p
-        (2560, 1440), # 2K (QHD)
-        (3840, 2160)  # 4K (UHD)
-    ]
-
     print("\nChecking resolution support:")
     supported_resolutions = []
-    for width, height in common_resolutions:
+    for width, height in COMMON_RESOLUTIONS:
         cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
         cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
         
@@ -102,5 +107,173 @@ def measure_camera_resolution(camera_index=0):
     cv2.destroyAllWindows()
     print("\nCamera resolution measurement program exited.")
 
+# === Camera Profile Benchmark ===
+def open_camera_with_settings(camera_index, width, height, fourcc, buffer_size):
+    """
+    Opens the camera with a pixel format, buffer size and resolution (in the order V4L2 needs them).
+    Returns (cap, (width, height, fourcc, buffer_size) actually in effect), or (None, None).
+    """
+    cap = cv2.VideoCapture(camera_index)
+    if not cap.isOpened():
+        return None, None
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, buffer_size)
+    actual_width, actual_height = set_capture_size(cap, (width, height))
+    actual_fourcc = fourcc_to_str(cap.get(cv2.CAP_PROP_FOURCC))
+    actual_buffer_size = int(cap.get(cv2.CAP_PROP_BUFFERSIZE))
+    return cap, (actual_width, actual_height, actual_fourcc, actual_buffer_size)
+
+def measure_stream(cap, duration=3.0, warmup_frames=10):
+    """
+    Measures a running stream:
+      fps              - sustained frames per second over `duration` seconds
+      decode_ms        - average time of retrieve(), i.e. decoding/converting one frame
+      cpu_ms_per_frame - process CPU time per frame (grab + decode)
+      cpu_percent      - process CPU time as a percentage of one core
+      queued_frames    - frames the driver hands out immediately after a pause, i.e. how stale a frame can be
+      latency_ms       - estimated capture-to-use latency: queued frames plus one decode
+    Returns None if the stream delivered no frames.
+    """
+    for _ in range(warmup_frames):
+        if not cap.read()[0]:
+            return None
+
+    frames = 0
+    decode_time = 0.0
+    cpu_start = time.process_time()
+    start_time = time.perf_counter()
+    while time.perf_counter() - start_time < duration:
+        if not cap.grab():
+            break
+        decode_start = time.perf_counter()
+        ret, _ = cap.retrieve()
+        if not ret:
+            break
+        decode_time += time.perf_counter() - decode_start
+        frames += 1
+    elapsed = time.perf_counter() - start_time
+    cpu_time = time.process_time() - cpu_start
+    if frames == 0:
+        return None
+
+    fps = frames / elapsed
+    frame_interval = 1.0 / fps
+    decode_ms = decode_time / frames * 1000
+
+    # After a pause the driver's queue is full; every grab that returns at once is an old frame
+    time.sleep(0.5)
+    queued_frames = 0
+    for _ in range(16):
+        grab_start = time.perf_counter()
+        if not cap.grab() or time.perf_counter() - grab_start > 0.3 * frame_interval:
+            break
+        queued_frames += 1
+
+    return {
+        "fps": round(fps, 2),
+        "decode_ms": round(decode_ms, 2),
+        "cpu_ms_per_frame": round(cpu_time / frames * 1000, 2),
+        "cpu_percent": round(cpu_time / elapsed * 100, 1),
+        "queued_frames": queued_frames,
+        "latency_ms": round(queued_frames * frame_interval * 1000 + decode_ms, 1),
+    }
+
+def benchmark_camera(camera_index=0, resolutions=COMMON_RESOLUTIONS, fourccs=BENCHMARK_FOURCCS,
+                     buffer_sizes=BENCHMARK_BUFFER_SIZES, duration=3.0):
+    """Measures every resolution x FOURCC x buffer size the camera accepts. Returns a list of result dicts."""
+    results = []
+    for width, height in resolutions:
+        for fourcc in fourccs:
+            for buffer_size in buffer_sizes:
+                label = f"{width}x{height} {fourcc} buffer={buffer_size}"
+                cap, actual = open_camera_with_settings(camera_index, width, height, fourcc, buffer_size)
+                if cap is None:
+                    print(f"  - {label}: Could not open camera {camera_index}")
+                    continue
+                try:
+                    actual_width, actual_height, actual_fourcc, actual_buffer_size = actual
+                    if (actual_width, actual_height) != (width, height) or actual_fourcc != fourcc:
+                        print(f"  - {label}: Not supported (actual: {actual_width}x{actual_height} {actual_fourcc})")
+                        continue
+                    measurement = measure_stream(cap, duration)
+                finally:
+                    cap.release()
+                if measurement is None:
+                    print(f"  - {label}: No frames delivered")
+                    continue
+                result = {"width": width, "height": height, "fourcc": fourcc,
+                          "buffer_size": buffer_size, "actual_buffer_size": actual_buffer_size}
+                result.update(measurement)
+                results.append(result)
+                print(f"  - {label}: {measurement['fps']:.1f} FPS, latency {measurement['latency_ms']:.0f} ms, "
+                      f"decode {measurement['decode_ms']:.1f} ms, CPU {measurement['cpu_ms_per_frame']:.1f} ms/frame "
+                      f"({measurement['cpu_percent']:.0f}%)")
+    return results
+
+def choose_camera_profile(results, min_fps=15.0, min_preview_side=480, min_snapshot_fps=2.0):
+    """
+    Picks the profile for the UIs' dual-stream capture, or None if nothing qualifies:
+      preview  - a combination reaching min_fps with a short side of at least min_preview_side,
+                 lowest latency first, then lowest CPU per frame, then the larger resolution;
+                 its FOURCC and buffer size are used for the device since it streams in preview mode
+      snapshot - the largest resolution that FOURCC delivers at min_snapshot_fps or more
+    """
+    preview_candidates = [r for r in results if r["fps"] >= min_fps and min(r["width"], r["height"]) >= min_preview_side]
+    if not preview_candidates:
+        return None
+    preview = min(preview_candidates, key=lambda r: (r["latency_ms"], r["cpu_ms_per_frame"], -r["width"] * r["height"]))
+
+    snapshot_candidates = [r for r in results if r["fourcc"] == preview["fourcc"] and r["fps"] >= min_snapshot_fps]
+    snapshot = max(snapshot_candidates, key=lambda r: (r["width"] * r["height"], -r["cpu_ms_per_frame"]))
+
+    return {
+        "fourcc": preview["fourcc"],
+        "buffer_size": preview["buffer_size"],
+        "preview_width": preview["width"],
+        "preview_height": preview["height"],
+        "snapshot_width": snapshot["width"],
+        "snapshot_height": snapshot["height"],
+        "preview_measurement": preview,
+        "snapshot_measurement": snapshot,
+    }
+
+def run_benchmark(camera_index, resolutions, duration, min_fps, min_preview_side, output_file):
+    print(f"Benchmarking camera {camera_index} ({duration:.0f} s per combination)...")
+    results = benchmark_camera(camera_index, resolutions, duration=duration)
+    profile = choose_camera_profile(results, min_fps, min_preview_side)
+    if profile is None:
+        print(f"\nNo combination reached {min_fps} FPS at a short side of {min_preview_side} px or more. No profile written.")
+        return None
+
+    profile["camera_index"] = camera_index
+    profile["measured_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    profile["results"] = results
+    with open(output_file, "w") as f:
+        json.dump(profile, f, indent=2)
+    print(f"\nBest profile: {profile['fourcc']}, buffer size {profile['buffer_size']}, "
+          f"preview {profile['preview_width']}x{profile['preview_height']}, "
+          f"snapshot {profile['snapshot_width']}x{profile['snapshot_height']}")
+    print(f"Saved camera profile to '{output_file}'. The UIs use it from their next start.")
+    return profile
+
+def parse_resolutions(text):
+    return [tuple(int(v) for v in item.lower().split("x")) for item in text.split(",") if item.strip()]
+
 if __name__ == "__main__":
-    measure_camera_resolution(camera_index=0) # You can change the camera index if needed
+    parser = argparse.ArgumentParser(description="Check camera resolutions or benchmark capture profiles.")
+    parser.add_argument("--camera", type=int, default=0, help="Camera index (default: 0).")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Measure FPS, latency and CPU for every resolution x FOURCC x buffer size and save the best profile.")
+    parser.add_argument("--resolutions", type=parse_resolutions, default=COMMON_RESOLUTIONS,
+                        help="Comma-separated WxH list to benchmark (default: common resolutions).")
+    parser.add_argument("--duration", type=float, default=3.0, help="Seconds measured per combination (default: 3).")
+    parser.add_argument("--min-fps", type=float, default=15.0, help="Minimum sustained FPS for the preview stream (default: 15).")
+    parser.add_argument("--min-preview-side", type=int, default=480,
+                        help="Minimum short side in pixels for the preview stream (default: 480).")
+    parser.add_argument("--output", default=CAMERA_PROFILE_FILE, help="Where to write the profile (default: camera_profile.json).")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_benchmark(args.camera, args.resolutions, args.duration, args.min_fps, args.min_preview_side, args.output)
+    else:
+        measure_camera_resolution(camera_index=args.camera)
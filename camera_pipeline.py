@@ -0,0 +1,461 @@
+import os
+import json
+import time
+import threading
+import cv2
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Written by 'python camera_measure.py --benchmark'; read by the UIs' camera setup at startup
+CAMERA_PROFILE_FILE = os.path.join(BASE_DIR, "camera_profile.json")
+CAMERA_PROFILE_KEYS = ("fourcc", "buffer_size", "preview_width", "preview_height", "snapshot_width", "snapshot_height")
+
+
+# === Latest-Value Slot ===
+class LatestSlot:
+    """
+    Holds only the most recent value put into it, plus a sequence number that increases with every put.
+    Producers never block and consumers always see the newest value; older values are simply dropped.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._value = None
+        self._seq = 0
+
+    def put(self, value):
+        with self._condition:
+            self._value = value
+            self._seq += 1
+            self._condition.notify_all()
+
+    def get(self):
+        """Returns (seq, value) without waiting. seq is 0 and value None until the first put."""
+        with self._condition:
+            return self._seq, self._value
+
+    def wait_newer(self, seq, timeout=None):
+        """Waits until a value newer than seq is available. Returns (seq, value), or (seq, None) on timeout."""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._seq > seq, timeout=timeout):
+                return seq, None
+            return self._seq, self._value
+
+
+# === Display Geometry ===
+def compute_display_crop(frame_width, frame_height, label_width, label_height):
+    """
+    Returns (crop_x, crop_y, crop_w, crop_h): the centered region of the frame with the label's aspect ratio.
+    """
+    target_aspect_ratio = label_width / label_height
+    original_aspect_ratio = frame_width / frame_height
+
+    crop_x, crop_y, crop_w, crop_h = 0, 0, frame_width, frame_height
+
+    if original_aspect_ratio > target_aspect_ratio:
+        crop_w = int(frame_height * target_aspect_ratio)
+        crop_x = (frame_width - crop_w) // 2
+    else:
+        crop_h = int(frame_width / target_aspect_ratio)
+        crop_y = (frame_height - crop_h) // 2
+    return crop_x, crop_y, crop_w, crop_h
+
+
+def set_capture_size(cap, size):
+    """Asks a cv2.VideoCapture for a (width, height) resolution; returns the size the camera actually uses."""
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, size[0])
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, size[1])
+    return int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+
+# === Camera Profile ===
+def load_camera_profile(path=CAMERA_PROFILE_FILE):
+    """Returns the measured camera profile as a dict, or None if there is no usable profile."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            profile = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read camera profile '{path}': {e}. Using the built-in camera settings.")
+        return None
+    missing = [key for key in CAMERA_PROFILE_KEYS if key not in profile]
+    if missing:
+        print(f"Warning: Camera profile '{path}' is missing {', '.join(missing)}. Using the built-in camera settings.")
+        return None
+    return profile
+
+
+def fourcc_to_str(value):
+    value = int(value)
+    return "".join(chr((value >> (8 * i)) & 0xFF) for i in range(4))
+
+
+def apply_camera_profile(cap, profile):
+    """Sets the profile's pixel format and buffer size. Call before setting the resolution."""
+    if not profile:
+        return
+    if profile.get("fourcc"):
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*profile["fourcc"]))
+    if profile.get("buffer_size"):
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, profile["buffer_size"])
+
+
+# === Capture Thread ===
+class CaptureThread:
+    """
+    Reads frames from an opened cv2.VideoCapture as fast as the camera delivers them and keeps only
+    the newest one in `slot` as (frame, prepared), where prepared = prepare(frame) if a prepare
+    callable was given (e.g. building the display image off the Tk thread).
+    While `idle` is set, frames are only grabbed (not decoded or published), which keeps the stream and
+    the camera's auto-exposure running at almost no CPU cost.
+    request_snapshot(callback) hands the next frame to callback on this thread; with a snapshot_size, the
+    camera is switched to that resolution for the one frame (dropping switch_discard_frames frames the
+    camera may still deliver at the old settings or exposure) and then back to preview_size.
+    While `hold_snapshot_size` is set, the camera stays at snapshot_size after a snapshot, so a burst of
+    snapshots restarts the stream only once; preview frames keep flowing, downscaled to the preview size.
+    Sets `failed` and stops if the camera stops delivering frames.
+    """
+
+    def __init__(self, cap, prepare=None, idle=False, preview_size=None, snapshot_size=None, switch_discard_frames=5):
+        self.cap = cap
+        self.prepare = prepare
+        self.idle = idle
+        self.preview_size = preview_size
+        self.snapshot_size = snapshot_size
+        self.switch_discard_frames = switch_discard_frames
+        self.hold_snapshot_size = False
+        self.slot = LatestSlot()
+        self.failed = False
+        self._at_snapshot_size = False
+        self._preview_frame_size = None
+        self._snapshot_callbacks = []
+        self._snapshot_lock = threading.Lock()
+        self._running = False
+        self._thread = None
+
+    def request_snapshot(self, callback):
+        with self._snapshot_lock:
+            self._snapshot_callbacks.append(callback)
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    def _run(self):
+        while self._running:
+            with self._snapshot_lock:
+                callbacks, self._snapshot_callbacks = self._snapshot_callbacks, []
+            if callbacks:
+                self._take_snapshot(callbacks)
+                continue
+            if self._at_snapshot_size and not self.hold_snapshot_size:
+                self._switch_resolution(False)
+            if self.idle:
+                if not self.cap.grab():
+                    self.failed = True
+                    break
+                continue
+            ret, frame = self.cap.read()
+            if not ret:
+                self.failed = True
+                break
+            if not self._at_snapshot_size:
+                self._preview_frame_size = (frame.shape[1], frame.shape[0])
+            else:
+                # Held at snapshot resolution: consumers keep getting frames of the preview size
+                frame = cv2.resize(frame, self._preview_frame_size or self.preview_size, interpolation=cv2.INTER_AREA)
+            prepare = self.prepare
+            try:
+                prepared = prepare(frame) if prepare is not None else None
+            except Exception as e:
+                print(f"Capture thread: Error preparing frame: {e}")
+                continue
+            self.slot.put((frame, prepared))
+
+    def _switch_resolution(self, to_snapshot):
+        """Restarts the stream at snapshot_size or back at preview_size (one V4L2 stream restart each)."""
+        set_capture_size(self.cap, self.snapshot_size if to_snapshot else self.preview_size)
+        self._at_snapshot_size = to_snapshot
+        if to_snapshot:
+            for _ in range(self.switch_discard_frames):
+                self.cap.grab()
+
+    def _take_snapshot(self, callbacks):
+        start_time = time.perf_counter()
+        switched = self.snapshot_size is not None and not self._at_snapshot_size
+        if switched:
+            self._switch_resolution(True)
+        ret, frame = self.cap.read()
+        if self._at_snapshot_size and not self.hold_snapshot_size:
+            self._switch_resolution(False)
+            switched = True
+        if switched:
+            print(f"Capture thread: Snapshot took {(time.perf_counter() - start_time) * 1000:.0f} ms including mode switches.")
+        for callback in callbacks:
+            try:
+                callback(frame if ret else None)
+            except Exception as e:
+                print(f"Capture thread: Error in snapshot callback: {e}")
+
+
+# === Persistent Camera Service ===
+class CameraService:
+    """
+    Keeps the camera open for the lifetime of the app, so a transaction's camera window gets usable frames
+    right away instead of paying device open, resolution negotiation and auto-exposure settling each time.
+
+    open_camera() must return an opened cv2.VideoCapture, or None if the camera is not available; it is
+    called again on the next subscribe after a failure. Between subscribers the stream is kept warm
+    (frames are grabbed but not decoded). A subscriber reads (frame, prepared) items from `slot` whose
+    sequence number is newer than the one subscribe() returned.
+
+    Dual-stream capture: with a preview_size different from snapshot_size, the stream runs at the low
+    preview resolution and request_snapshot() switches to snapshot_size for a single full-resolution
+    frame. For a burst of snapshots (enrollment), hold_snapshot_resolution(True) keeps the camera at
+    snapshot_size from the first snapshot until it is released. Without a preview_size, the stream runs
+    at whatever open_camera() set up.
+    """
+
+    def __init__(self, open_camera, preview_size=None, snapshot_size=None):
+        self.open_camera = open_camera
+        self.preview_size = tuple(preview_size) if preview_size else None
+        self.snapshot_size = tuple(snapshot_size) if snapshot_size else None
+        self._lock = threading.Lock()
+        self._cap = None
+        self._capture = None
+        self._subscribers = 0
+        self._hold_snapshot_size = False
+
+    @property
+    def slot(self):
+        return self._capture.slot
+
+    @property
+    def failed(self):
+        return self._capture is None or self._capture.failed
+
+    @property
+    def dual_stream(self):
+        return self.preview_size is not None and self.preview_size != self.snapshot_size
+
+    def request_snapshot(self, callback, preview_frame=None):
+        """
+        Calls callback(frame) with a full-resolution frame (None if the camera failed). In single-stream
+        mode that is preview_frame itself, if given, without waiting. Otherwise the callback runs on the
+        capture thread once the snapshot has been taken, so it must be quick and thread-safe.
+        """
+        if not self.dual_stream and preview_frame is not None:
+            callback(preview_frame)
+            return
+        with self._lock:
+            if self._capture is None:
+                callback(None)
+                return
+            self._capture.request_snapshot(callback)
+
+    def hold_snapshot_resolution(self, hold):
+        """While held, the camera is not switched back to the preview resolution between snapshots."""
+        with self._lock:
+            self._hold_snapshot_size = hold
+            if self._capture is not None:
+                self._capture.hold_snapshot_size = hold
+
+    def start(self):
+        """Opens the camera and starts the warm stream. Returns False if the camera could not be opened."""
+        with self._lock:
+            return self._ensure_open()
+
+    def subscribe(self, prepare=None):
+        """
+        Starts decoding and publishing frames, with prepared = prepare(frame) if given.
+        Returns the slot's current sequence number (older items predate the subscription),
+        or None if the camera could not be opened.
+        """
+        with self._lock:
+            if not self._ensure_open():
+                return None
+            self._subscribers += 1
+            self._capture.prepare = prepare
+            self._capture.idle = False
+            return self._capture.slot.get()[0]
+
+    def unsubscribe(self):
+        """Returns the stream to the warm idle state once the last subscriber has left."""
+        with self._lock:
+            self._subscribers = max(0, self._subscribers - 1)
+            if self._subscribers == 0:
+                self._hold_snapshot_size = False
+                if self._capture is not None:
+                    self._capture.idle = True
+                    self._capture.prepare = None
+                    self._capture.hold_snapshot_size = False
+
+    def stop(self):
+        with self._lock:
+            self._close()
+
+    def _ensure_open(self):
+        if self._capture is not None and not self._capture.failed:
+            return True
+        self._close()
+        cap = self.open_camera()
+        if cap is None:
+            return False
+        self._cap = cap
+        snapshot_size = None
+        if self.dual_stream:
+            snapshot_size = self.snapshot_size
+            actual_size = set_capture_size(cap, self.preview_size)
+            print(f"Camera service: Preview stream at {actual_size[0]}x{actual_size[1]}, snapshots at {snapshot_size[0]}x{snapshot_size[1]}.")
+        self._capture = CaptureThread(cap, idle=self._subscribers == 0, preview_size=self.preview_size, snapshot_size=snapshot_size)
+        self._capture.hold_snapshot_size = self._hold_snapshot_size
+        self._capture.start()
+        return True
+
+    def _close(self):
+        if self._capture is not None:
+            self._capture.stop()
+            self._capture = None
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+
+# === Detection Cadence ===
+class DetectionScheduler:
+    """
+    Decides when the live preview runs a full face detection instead of reusing the last result.
+
+    rate_hz:         upper bound on detections per second (None = no fixed rate)
+    every_k_frames:  run at most once every k new camera frames (None = no frame-based limit)
+    max_duty_cycle:  fraction of wall time the detector may occupy; the interval between detections
+                     grows with the measured (smoothed) detector latency, leaving CPU for recognition
+    verify_rate_hz:  upper bound on detections per second while `tracking` is set, i.e. while a tracker
+                     follows the face and detection only verifies it (None = rate_hz applies throughout)
+    """
+
+    def __init__(self, rate_hz=None, every_k_frames=None, max_duty_cycle=None, verify_rate_hz=None):
+        self.rate_hz = rate_hz
+        self.every_k_frames = every_k_frames
+        self.max_duty_cycle = max_duty_cycle
+        self.verify_rate_hz = verify_rate_hz
+        self.tracking = False # Set by the detect callable when the last detection started a track
+        self.latency = None # Smoothed detector latency in seconds
+        self._last_frame_seq = None
+        self._next_due = 0.0
+
+    def due(self, frame_seq, now=None):
+        """True if a full detection should run on the frame with this sequence number."""
+        now = time.perf_counter() if now is None else now
+        if self.every_k_frames and self._last_frame_seq is not None \
+                and frame_seq - self._last_frame_seq < self.every_k_frames:
+            return False
+        return now >= self._next_due
+
+    def time_until_due(self, now=None):
+        now = time.perf_counter() if now is None else now
+        return max(0.0, self._next_due - now)
+
+    def request_now(self):
+        """Makes the next frame due for a full detection, e.g. after the tracker lost the face."""
+        self.tracking = False
+        self._next_due = 0.0
+        self._last_frame_seq = None
+
+    def record(self, frame_seq, started_at, latency):
+        """Registers a finished detection and schedules the next one."""
+        self.latency = latency if self.latency is None else 0.7 * self.latency + 0.3 * latency
+        self._last_frame_seq = frame_seq
+
+        interval = 1.0 / self.rate_hz if self.rate_hz else 0.0
+        if self.tracking and self.verify_rate_hz:
+            interval = max(interval, 1.0 / self.verify_rate_hz)
+        if self.max_duty_cycle:
+            interval = max(interval, self.latency / self.max_duty_cycle)
+        self._next_due = started_at + interval
+
+
+# === Detection Thread ===
+class DetectionThread:
+    """
+    Runs detect(frame) on the newest frame of a CaptureThread at its own pace, so the preview never waits
+    on the detector. Results are published to `slot` as (frame, result), where frame is the exact frame
+    the result was computed on. `last_latency` holds the duration of the latest detect call in seconds.
+    With a DetectionScheduler, detection only runs when the scheduler says it is due; in between,
+    consumers keep seeing the last published result, or, if a track(frame) callable is given, a cheap
+    tracker update at most track_rate_hz times per second (None = on every new frame). track returns
+    (result, lost): a result to publish, or lost=True to re-detect at once.
+    Frames with a sequence number up to start_seq (e.g. from before a CameraService subscription) are skipped.
+    """
+
+    def __init__(self, frame_slot, detect, scheduler=None, track=None, start_seq=0, track_rate_hz=None):
+        self.frame_slot = frame_slot
+        self.detect = detect
+        self.scheduler = scheduler
+        self.track = track
+        self.start_seq = start_seq
+        self.track_interval = 1.0 / track_rate_hz if track_rate_hz else 0.0
+        self.slot = LatestSlot()
+        self.last_latency = 0.0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    def _run(self):
+        seq = self.start_seq
+        next_track = 0.0
+        while self._running:
+            if self.scheduler is not None:
+                # Sleep until the next detection or tracker update is due instead of waking up for every frame
+                delay = self.scheduler.time_until_due()
+                if self.track is not None:
+                    delay = min(delay, next_track - time.perf_counter())
+                if delay > 0:
+                    time.sleep(min(delay, 0.2))
+                    continue
+            seq, item = self.frame_slot.wait_newer(seq, timeout=0.2)
+            if item is None:
+                continue
+            frame = item[0]
+            if self.scheduler is not None and not self.scheduler.due(seq):
+                now = time.perf_counter()
+                if self.track is not None and now >= next_track:
+                    next_track = now + self.track_interval
+                    self._track(frame)
+                continue
+            start_time = time.perf_counter()
+            try:
+                result = self.detect(frame)
+            except Exception as e:
+                print(f"Detection thread: Error during detection: {e}")
+                continue
+            self.last_latency = time.perf_counter() - start_time
+            if self.scheduler is not None:
+                self.scheduler.record(seq, start_time, self.last_latency)
+            self.slot.put((frame, result))
+
+    def _track(self, frame):
+        try:
+            result, lost = self.track(frame)
+        except Exception as e:
+            print(f"Detection thread: Error during tracking: {e}")
+            return
+        if lost:
+            self.scheduler.request_now()
+        elif result is not None:
+            self.slot.put((frame, result))
@@ -1,18 +1,18 @@
-import pickle
 import os
 import numpy as np # Import numpy for array comparison
+from embedding_store import load_face_data
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# Adjust this path if your face_cosine_data.pkl is in a different location
+# Adjust this path if your embeddings store is in a different location
 # This path assumes 'check_train.py' is at the same level as 'train.py'
-# and 'face_cosine_data.pkl' is inside 'Code/embeddings' relative to BASE_DIR
-embeddings_file_path = os.path.join(BASE_DIR, "Code", "embeddings", "face_cosine_data.pkl")
+# and 'face_embeddings.json' is inside 'Code/embeddings' relative to BASE_DIR
+embeddings_file_path = os.path.join(BASE_DIR, "Code", "embeddings", "face_embeddings.json")
 
 try:
-    with open(embeddings_file_path, "rb") as f:
-        face_data_loaded = pickle.load(f)
-    print("Successfully loaded face_cosine_data.pkl")
+    # Reads the store the same way train.py and the UIs do (migrating an old pickle if needed)
+    face_data_loaded = load_face_data(embeddings_file_path)
+    print("Successfully loaded face_embeddings.json")
     print("Content of face_data_loaded:")
     
     if not face_data_loaded:
@@ -42,4 +42,4 @@ try:
 except FileNotFoundError:
     print(f"Error: The file '{embeddings_file_path}' was not found.")
 except Exception as e:
-    print(f"An unexpected error occurred while loading or inspecting the pickle file: {e}")
\ No newline at end of file
+    print(f"An unexpected error occurred while loading or inspecting the embeddings store: {e}")
\ No newline at end of file
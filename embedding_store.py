@@ -0,0 +1,422 @@
+import os
+import json
+import pickle
+import threading
+import contextlib
+
+import numpy as np
+
+# File locking keeps the UI and train.py from writing the store at the same time (not available on Windows)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# === Embedding Index ===
+class EmbeddingIndex:
+    """
+    Holds every stored locker embedding as one pre-normalized, contiguous float32 matrix
+    with a parallel array of locker IDs, so matching a face is a single matrix-vector
+    product plus an argmax instead of a Python loop over every stored embedding.
+    """
+
+    def __init__(self, matrix, locker_ids):
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        if matrix.ndim != 2:
+            matrix = matrix.reshape(len(locker_ids), -1)
+        self.matrix = matrix
+        self.locker_ids = np.asarray(locker_ids, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.locker_ids)
+
+    def match(self, candidate_embedding):
+        """
+        Returns (locker_id, similarity) of the stored embedding with the highest cosine
+        similarity to the candidate, or (0, -1.0) if the index is empty.
+        """
+        if len(self) == 0:
+            return 0, -1.0
+        candidate = np.asarray(candidate_embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(candidate)
+        if norm == 0:
+            return 0, -1.0
+        similarities = self.matrix @ (candidate / norm)
+        best_row = int(np.argmax(similarities))
+        return int(self.locker_ids[best_row]), float(similarities[best_row])
+
+
+def normalize_rows(matrix):
+    """L2-normalizes every row of a 2D embedding matrix (zero rows are left as zeros)."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+
+# === On-Disk Store Format ===
+# The store is two files in the embeddings directory:
+#   face_embeddings.json      - header: format/version, generation, dtype, dimension and, per locker,
+#                               the [start, stop) row range it owns in the matrix file
+#   face_embeddings_<gen>.bin - one raw little-endian float32/float16 matrix of L2-normalized rows
+# The header is the commit point: it is always replaced atomically after the matrix data is fsynced,
+# so readers memory-map exactly the rows the header describes. New lockers are appended to the
+# matrix file, removed lockers only disappear from the header, and the file is compacted into a
+# new generation once dead rows outnumber live ones.
+STORE_FORMAT = "smart-locker-embeddings"
+STORE_VERSION = 1
+STORE_DTYPES = {"float32": "<f4", "float16": "<f2"}
+DEFAULT_STORE_DTYPE = "float32"
+LEGACY_PICKLE_NAME = "face_cosine_data.pkl"
+
+
+def read_store_header(store_file):
+    """Reads and validates the store header. Raises FileNotFoundError if there is no store yet."""
+    with open(store_file, "r") as f:
+        header = json.load(f)
+    if header.get("format") != STORE_FORMAT:
+        raise ValueError(f"'{store_file}' is not an embeddings store header.")
+    if header.get("version") != STORE_VERSION:
+        raise ValueError(f"Unsupported embeddings store version {header.get('version')} (expected {STORE_VERSION}).")
+    if header.get("dtype") not in STORE_DTYPES:
+        raise ValueError(f"Unsupported embeddings store dtype '{header.get('dtype')}'.")
+    return header
+
+
+def open_store_matrix(store_file, header):
+    """Memory-maps the committed rows of the store's matrix file (read-only, zero-copy)."""
+    dtype = np.dtype(STORE_DTYPES[header["dtype"]])
+    if header["rows"] == 0 or header["dim"] == 0:
+        return np.empty((0, header["dim"]), dtype=dtype)
+    matrix_path = os.path.join(os.path.dirname(store_file), header["matrix"])
+    return np.memmap(matrix_path, dtype=dtype, mode="r", shape=(header["rows"], header["dim"]))
+
+
+def _live_ranges(header):
+    """Returns [(locker_name, start, stop), ...] for every locker in the header, in row order."""
+    return sorted(((name, start, stop) for name, (start, stop) in header["lockers"].items()),
+                  key=lambda item: item[1])
+
+
+# === Embeddings Store Loading ===
+def load_index(store_file):
+    """
+    Builds the EmbeddingIndex straight from the memory-mapped matrix. When the file holds no dead
+    rows and is stored as float32, the index uses the mapping itself and nothing is copied.
+    """
+    ensure_migrated(store_file)
+    header = read_store_header(store_file)
+    matrix = open_store_matrix(store_file, header)
+
+    locker_ids = []
+    slices = []
+    for name, start, stop in _live_ranges(header):
+        try:
+            person_id = int(name) # Assume person_name is the locker ID
+        except ValueError:
+            print(f"Warning: Non-integer person name '{name}' in embeddings. Skipping.")
+            continue
+        locker_ids.extend([person_id] * (stop - start))
+        slices.append((start, stop))
+
+    covers_whole_file = sum(stop - start for start, stop in slices) == header["rows"]
+    if covers_whole_file:
+        # Live rows are exactly the file's rows, in order, because ranges never overlap
+        rows = matrix
+    elif slices:
+        rows = np.concatenate([matrix[start:stop] for start, stop in slices])
+    else:
+        rows = np.empty((0, header["dim"]), dtype=np.float32)
+    return EmbeddingIndex(rows, locker_ids)
+
+
+def load_face_data(store_file):
+    """Returns the store as a {locker_name: [embedding, ...]} dict (embeddings are L2-normalized)."""
+    ensure_migrated(store_file)
+    header = read_store_header(store_file)
+    matrix = open_store_matrix(store_file, header)
+    return {name: [np.asarray(row, dtype=np.float32) for row in matrix[start:stop]]
+            for name, start, stop in _live_ranges(header)}
+
+
+def store_signature(store_file):
+    """
+    Returns a cheap fingerprint (mtime, size, inode) of the store header, or None if it does not exist.
+    Every committed change replaces the header and bumps its generation, so one of these values changes.
+    """
+    try:
+        st = os.stat(store_file)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+# === Embeddings Store Writing ===
+@contextlib.contextmanager
+def _store_lock(store_file):
+    """Serializes writers (the UI process and train.py) on a lock file next to the header."""
+    os.makedirs(os.path.dirname(store_file), exist_ok=True)
+    with open(store_file + ".lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _fsync_dir(directory):
+    """Flushes a directory entry so a rename survives a power cut (no-op where unsupported)."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _write_header(store_file, header):
+    """Atomically and durably replaces the store header."""
+    tmp_file = store_file + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(header, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, store_file)
+    _fsync_dir(os.path.dirname(store_file))
+
+
+def _try_read_header(store_file):
+    try:
+        return read_store_header(store_file)
+    except FileNotFoundError:
+        return None
+
+
+def _embeddings_to_rows(embeddings):
+    if len(embeddings) == 0:
+        return np.empty((0, 0), dtype=np.float32)
+    return normalize_rows(np.stack([np.asarray(emb, dtype=np.float32).ravel() for emb in embeddings]))
+
+
+def _save_unlocked(store_file, face_data, dtype, old_header):
+    generation = old_header["generation"] + 1 if old_header else 1
+    stem = os.path.splitext(os.path.basename(store_file))[0]
+    matrix_name = f"{stem}_{generation}.bin"
+    matrix_path = os.path.join(os.path.dirname(store_file), matrix_name)
+
+    lockers = {}
+    dim = 0
+    rows = 0
+    with open(matrix_path, "wb") as f:
+        for name, embeddings in face_data.items():
+            locker_rows = _embeddings_to_rows(embeddings)
+            if len(locker_rows):
+                if dim and locker_rows.shape[1] != dim:
+                    raise ValueError(f"Embedding size {locker_rows.shape[1]} for locker {name} does not match {dim}.")
+                dim = locker_rows.shape[1]
+                f.write(locker_rows.astype(STORE_DTYPES[dtype]).tobytes())
+            lockers[str(name)] = [rows, rows + len(locker_rows)]
+            rows += len(locker_rows)
+        f.flush()
+        os.fsync(f.fileno())
+
+    _write_header(store_file, {
+        "format": STORE_FORMAT,
+        "version": STORE_VERSION,
+        "generation": generation,
+        "dtype": dtype,
+        "dim": dim,
+        "rows": rows,
+        "matrix": matrix_name,
+        "lockers": lockers,
+    })
+
+    # Readers that still map the previous generation keep their (now unlinked) file until they reload
+    if old_header and old_header["matrix"] != matrix_name:
+        try:
+            os.remove(os.path.join(os.path.dirname(store_file), old_header["matrix"]))
+        except OSError:
+            pass
+
+
+def save_face_data(store_file, face_data, dtype=DEFAULT_STORE_DTYPE):
+    """
+    Writes a complete {locker_name: [embedding, ...]} dict as a new store generation.
+    dtype is "float32" or "float16" (half the size on disk, converted to float32 when loaded).
+    """
+    if dtype not in STORE_DTYPES:
+        raise ValueError(f"Unsupported embeddings store dtype '{dtype}'.")
+    with _store_lock(store_file):
+        _save_unlocked(store_file, face_data, dtype, _try_read_header(store_file))
+
+
+def merge_locker_embeddings(store_file, locker_name, embeddings):
+    """
+    Replaces the embeddings of a single locker in the store, keeping every other locker as is.
+    The new rows are appended to the matrix file and only the header is rewritten.
+    Creates the store if it does not exist yet.
+    """
+    ensure_migrated(store_file)
+    locker_rows = _embeddings_to_rows(embeddings)
+    with _store_lock(store_file):
+        header = _try_read_header(store_file)
+        if header is None:
+            _save_unlocked(store_file, {str(locker_name): embeddings}, DEFAULT_STORE_DTYPE, None)
+            return
+
+        if len(locker_rows):
+            if header["dim"] and locker_rows.shape[1] != header["dim"]:
+                raise ValueError(f"Embedding size {locker_rows.shape[1]} does not match the store's {header['dim']}.")
+            header["dim"] = locker_rows.shape[1]
+
+        dtype = np.dtype(STORE_DTYPES[header["dtype"]])
+        start = header["rows"]
+        matrix_path = os.path.join(os.path.dirname(store_file), header["matrix"])
+        with open(matrix_path, "r+b" if os.path.exists(matrix_path) else "w+b") as f:
+            # Write right after the committed rows; anything beyond is left over from an interrupted write
+            f.seek(start * header["dim"] * dtype.itemsize)
+            f.write(locker_rows.astype(dtype).tobytes())
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+
+        header["lockers"][str(locker_name)] = [start, start + len(locker_rows)]
+        header["rows"] = start + len(locker_rows)
+        header["generation"] += 1
+
+        live_rows = sum(stop - start for _, start, stop in _live_ranges(header))
+        if header["rows"] - live_rows > live_rows:
+            _compact_unlocked(store_file, header)
+        else:
+            _write_header(store_file, header)
+
+
+def remove_locker_embeddings(store_file, locker_name):
+    """
+    Drops a single locker from the store in place and durably. Returns True if the locker was present.
+    Only the small header is rewritten; its rows become dead space that a later compaction reclaims.
+    """
+    ensure_migrated(store_file)
+    with _store_lock(store_file):
+        header = _try_read_header(store_file)
+        if header is None or header["lockers"].pop(str(locker_name), None) is None:
+            return False
+        header["generation"] += 1
+        _write_header(store_file, header)
+        return True
+
+
+def _compact_unlocked(store_file, header):
+    """Rewrites only the live rows into a new generation (header may describe uncommitted rows)."""
+    matrix = open_store_matrix(store_file, header)
+    face_data = {name: matrix[start:stop] for name, start, stop in _live_ranges(header)}
+    _save_unlocked(store_file, face_data, header["dtype"], header)
+
+
+# === Migration from the Pickle Store ===
+def _migrate_unlocked(pickle_file, store_file, dtype):
+    with open(pickle_file, "rb") as f:
+        face_data = pickle.load(f)
+    _save_unlocked(store_file, face_data, dtype, _try_read_header(store_file))
+    os.replace(pickle_file, pickle_file + ".migrated")
+    print(f"Migrated {len(face_data)} lockers from '{pickle_file}' to '{store_file}'.")
+
+
+def migrate_pickle_store(pickle_file, store_file, dtype=DEFAULT_STORE_DTYPE):
+    """
+    One-shot conversion of the old face_cosine_data.pkl into the binary store.
+    The pickle is renamed to *.migrated afterwards so it is not imported again.
+    """
+    if dtype not in STORE_DTYPES:
+        raise ValueError(f"Unsupported embeddings store dtype '{dtype}'.")
+    with _store_lock(store_file):
+        _migrate_unlocked(pickle_file, store_file, dtype)
+
+
+def ensure_migrated(store_file):
+    """Migrates a legacy pickle found next to store_file if the binary store does not exist yet."""
+    if os.path.exists(store_file):
+        return
+    pickle_file = os.path.join(os.path.dirname(store_file), LEGACY_PICKLE_NAME)
+    if not os.path.exists(pickle_file):
+        return
+    with _store_lock(store_file):
+        # Another process may have migrated while we waited for the lock
+        if not os.path.exists(store_file) and os.path.exists(pickle_file):
+            _migrate_unlocked(pickle_file, store_file, DEFAULT_STORE_DTYPE)
+
+
+# === Resident Embeddings Cache ===
+class EmbeddingCache:
+    """
+    Keeps the EmbeddingIndex for the store resident in memory.
+    The store is only re-read when its header changes (e.g. after train.py finishes),
+    so recognition reads cost a single stat() instead of reloading the store.
+    """
+
+    def __init__(self, store_file):
+        self.store_file = store_file
+        self._lock = threading.Lock()
+        self._index = None
+        self._signature = None
+
+    def get(self):
+        """
+        Returns the current EmbeddingIndex, reloading it first if the store has changed.
+        Raises FileNotFoundError if the store does not exist.
+        """
+        signature = store_signature(self.store_file)
+        if signature is None:
+            ensure_migrated(self.store_file)
+            signature = store_signature(self.store_file)
+            if signature is None:
+                raise FileNotFoundError(self.store_file)
+
+        with self._lock:
+            if signature != self._signature:
+                try:
+                    index = load_index(self.store_file)
+                except Exception as e:
+                    if self._index is None:
+                        raise
+                    # Keep serving the last good index and retry on the next call
+                    print(f"Warning: Could not reload embeddings ({e}). Using previously loaded embeddings.")
+                    return self._index
+                self._index = index
+                self._signature = signature
+                print(f"Loaded {len(self._index)} embeddings from {self.store_file}")
+            return self._index
+
+    def preload(self):
+        """Loads the store at startup if it exists. Errors are reported, not raised."""
+        try:
+            self.get()
+        except FileNotFoundError:
+            print(f"Embeddings store not found at '{self.store_file}'. It will be loaded once train.py creates it.")
+        except Exception as e:
+            print(f"Warning: Error preloading embeddings: {e}")
+
+    def invalidate(self):
+        """Forces the next get() to reload the store from disk."""
+        with self._lock:
+            self._signature = None
+
+
+if __name__ == "__main__":
+    import argparse
+
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+    embedding_dir = os.path.join(BASE_DIR, "Code", "embeddings")
+    parser = argparse.ArgumentParser(description="Migrate face_cosine_data.pkl to the memory-mapped embeddings store.")
+    parser.add_argument("--pickle", default=os.path.join(embedding_dir, LEGACY_PICKLE_NAME))
+    parser.add_argument("--store", default=os.path.join(embedding_dir, "face_embeddings.json"))
+    parser.add_argument("--dtype", choices=sorted(STORE_DTYPES), default=DEFAULT_STORE_DTYPE)
+    args = parser.parse_args()
+    migrate_pickle_store(args.pickle, args.store, args.dtype)
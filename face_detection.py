@@ -0,0 +1,461 @@
+import os
+import threading
+import cv2
+import numpy as np
+from onnx_sessions import get_onnx_session
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.join(BASE_DIR, "Code", "models")
+# Written by package_models.py
+MTCNN_WEIGHTS_FILE = os.path.join(MODELS_DIR, "mtcnn_weights.npy")
+
+
+# === Detection Results ===
+# Detections use the MTCNN result format throughout:
+#   {'box': [x, y, w, h], 'confidence': float, 'keypoints': {'left_eye': (x, y), ...}}
+
+def select_best_face(results, confidence_threshold):
+    """Returns the largest detection that meets the confidence threshold, or None."""
+    best_face_info = None
+    max_area = 0
+    for face_info in results:
+        if face_info['confidence'] >= confidence_threshold:
+            x, y, w, h = face_info['box']
+            area = w * h
+            if area > max_area:
+                max_area = area
+                best_face_info = face_info
+    return best_face_info
+
+
+def offset_face(face_info, dx, dy):
+    """Returns a copy of a detection moved by (dx, dy), e.g. from a crop back to full-frame coordinates."""
+    x, y, w, h = face_info['box']
+    keypoints = {name: (px + dx, py + dy) for name, (px, py) in face_info.get('keypoints', {}).items()}
+    return {'box': [x + dx, y + dy, w, h], 'confidence': face_info['confidence'], 'keypoints': keypoints}
+
+
+def scale_face(face_info, factor, factor_y=None):
+    """
+    Returns a copy of a detection with its box and keypoints multiplied by factor (rounded to pixels).
+    factor_y, if given, scales the vertical axis separately (e.g. between two capture resolutions).
+    """
+    factor_y = factor if factor_y is None else factor_y
+    x, y, w, h = face_info['box']
+    keypoints = {name: (int(round(px * factor)), int(round(py * factor_y)))
+                 for name, (px, py) in face_info.get('keypoints', {}).items()}
+    box = [int(round(x * factor)), int(round(y * factor_y)), int(round(w * factor)), int(round(h * factor_y))]
+    return {'box': box, 'confidence': face_info['confidence'], 'keypoints': keypoints}
+
+
+def downscale_image(img_array, max_side):
+    """Returns (image, scale): a copy whose longest side is at most max_side, or the image itself and 1.0."""
+    h_img, w_img = img_array.shape[:2]
+    scale = max_side / max(h_img, w_img) if max_side else 1.0
+    if scale >= 1.0:
+        return img_array, 1.0
+    small = cv2.resize(img_array, (max(1, int(w_img * scale)), max(1, int(h_img * scale))), interpolation=cv2.INTER_AREA)
+    return small, scale
+
+
+def detect_faces_downscaled(detector, img_array, max_side):
+    """
+    Runs detector.detect_faces on a copy of the image whose longest side is at most max_side pixels
+    and maps the detections back to the source image's coordinates. MTCNN's cost grows with the
+    image pyramid, so detecting on e.g. 640 px instead of 2048 px is several times faster, while the
+    face is still cropped from the full-resolution source afterwards.
+    """
+    small, scale = downscale_image(img_array, max_side)
+    if scale == 1.0:
+        return detector.detect_faces(img_array)
+    return [scale_face(face_info, 1.0 / scale) for face_info in detector.detect_faces(small)]
+
+
+def map_face_to_frame(face_info, source_frame, target_frame):
+    """Maps a detection from one frame to another of the same view at a different resolution."""
+    source_h, source_w = source_frame.shape[:2]
+    target_h, target_w = target_frame.shape[:2]
+    return scale_face(face_info, target_w / source_w, target_h / source_h)
+
+
+def detect_faces_in_region(detector, img_array, face_info, margin, max_side):
+    """
+    Runs the detector only on face_info's box grown by margin (a fraction of the box size) on every side,
+    e.g. to re-locate a face that may have moved a little since face_info was detected.
+    Returns the detections in the image's coordinates.
+    """
+    h_img, w_img = img_array.shape[:2]
+    x, y, w, h = face_info['box']
+    margin_x, margin_y = int(w * margin), int(h * margin)
+    x1, y1 = max(0, x - margin_x), max(0, y - margin_y)
+    x2, y2 = min(w_img, x + w + margin_x), min(h_img, y + h + margin_y)
+    if x2 <= x1 or y2 <= y1:
+        return []
+    region = img_array[y1:y2, x1:x2]
+    return [offset_face(result, x1, y1) for result in detect_faces_downscaled(detector, region, max_side)]
+
+
+def crop_face(img_array, face_info, required_size=(160, 160)):
+    """Crops a detection out of an image (clamped to the image bounds) and resizes it. Returns None if empty."""
+    x, y, w, h = face_info['box']
+
+    # Ensure coordinates are within image bounds
+    h_img, w_img = img_array.shape[:2]
+    x1, y1 = max(0, x), max(0, y)
+    x2, y2 = min(w_img, x + w), min(h_img, y + h)
+
+    face = img_array[y1:y2, x1:x2]
+
+    if face.shape[0] == 0 or face.shape[1] == 0: # Handle cases where crop results in empty image
+        return None
+
+    try:
+        face = cv2.resize(face, required_size)
+    except cv2.error as e:
+        print(f"Error resizing face: {e}")
+        return None
+    return face
+
+
+# === Detector Backends ===
+# Every backend exposes detect_faces(img) returning detections in the MTCNN result format, plus
+# min_confidence: the score a detection needs to count as a face for the stage using it.
+# The heavy part (the model) is loaded by load_model(**model options) so stages that use the same
+# backend and model files can share one instance (see create_detector).
+
+class HaarFaceDetector:
+    """OpenCV Haar cascade. Very cheap, but no real confidence score (every hit reports 1.0)."""
+    backend = "haar"
+    uses_model_lock = True
+    model_options = ("cascade_path",)
+
+    def __init__(self, model, min_confidence=0.0, scale_factor=1.1, min_neighbors=4, min_size=30, model_lock=None):
+        self.model = model
+        self.min_confidence = min_confidence
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+        self.model_lock = model_lock or threading.Lock()
+
+    @staticmethod
+    def load_model(cascade_path=None):
+        cascade_path = cascade_path or os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml')
+        cascade = cv2.CascadeClassifier(cascade_path)
+        if cascade.empty():
+            raise RuntimeError(f"Could not load face cascade classifier '{cascade_path}'.")
+        return cascade
+
+    def detect_faces(self, img_array):
+        gray = cv2.cvtColor(img_array, cv2.COLOR_BGR2GRAY) if img_array.ndim == 3 else img_array
+        with self.model_lock:
+            faces = self.model.detectMultiScale(gray, self.scale_factor, self.min_neighbors,
+                                                minSize=(self.min_size, self.min_size))
+        return [{'box': [int(x), int(y), int(w), int(h)], 'confidence': 1.0, 'keypoints': {}}
+                for (x, y, w, h) in faces]
+
+
+class MtcnnFaceDetector:
+    """
+    MTCNN (TensorFlow). The most accurate backend here and the slowest; the default for crops.
+    Uses the weights pinned into MTCNN_WEIGHTS_FILE by package_models.py if present, else the package's own.
+    """
+    backend = "mtcnn"
+    uses_model_lock = False # TensorFlow models can be called from several threads
+    model_options = ("weights_path",)
+
+    def __init__(self, model, min_confidence=0.0):
+        self.model = model
+        self.min_confidence = min_confidence
+
+    @staticmethod
+    def load_model(weights_path=None):
+        from mtcnn import MTCNN
+        if weights_path is not None and not os.path.exists(weights_path):
+            raise FileNotFoundError(f"MTCNN weights '{weights_path}' not found.")
+        weights_path = weights_path or MTCNN_WEIGHTS_FILE
+        if os.path.exists(weights_path):
+            return MTCNN(weights_file=weights_path)
+        return MTCNN()
+
+    def detect_faces(self, img_array):
+        return self.model.detect_faces(img_array)
+
+
+class YuNetFaceDetector:
+    """OpenCV's YuNet CNN detector (cv2.FaceDetectorYN, OpenCV >= 4.5.4). Fast, with five landmarks."""
+    backend = "yunet"
+    uses_model_lock = True
+    model_options = ("model_path",)
+    KEYPOINT_NAMES = ("right_eye", "left_eye", "nose", "mouth_right", "mouth_left")
+
+    def __init__(self, model, min_confidence=0.9, model_lock=None):
+        self.model = model
+        self.min_confidence = min_confidence
+        self.model_lock = model_lock or threading.Lock()
+
+    @staticmethod
+    def load_model(model_path=None):
+        model_path = model_path or os.path.join(MODELS_DIR, "face_detection_yunet_2023mar.onnx")
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"YuNet model '{model_path}' not found.")
+        create = getattr(cv2, "FaceDetectorYN_create", None) or cv2.FaceDetectorYN.create
+        # Keep every candidate above a low score; stages filter by their own min_confidence
+        return create(model_path, "", (320, 320), 0.5, 0.3, 5000)
+
+    def detect_faces(self, img_array):
+        h_img, w_img = img_array.shape[:2]
+        with self.model_lock: # setInputSize + detect must not interleave with another thread's call
+            self.model.setInputSize((w_img, h_img))
+            _, faces = self.model.detect(img_array)
+        results = []
+        for row in faces if faces is not None else []:
+            keypoints = {name: (int(row[4 + 2 * i]), int(row[5 + 2 * i])) for i, name in enumerate(self.KEYPOINT_NAMES)}
+            results.append({'box': [int(v) for v in row[:4]], 'confidence': float(row[14]), 'keypoints': keypoints})
+        return results
+
+
+class SsdFaceDetector:
+    """OpenCV DNN ResNet-10 SSD face detector (the Caffe model from OpenCV's samples/dnn/face_detector)."""
+    backend = "ssd"
+    uses_model_lock = True
+    model_options = ("prototxt_path", "model_path")
+    INPUT_SIZE = (300, 300)
+    MEAN = (104.0, 177.0, 123.0)
+
+    def __init__(self, model, min_confidence=0.5, model_lock=None):
+        self.model = model
+        self.min_confidence = min_confidence
+        self.model_lock = model_lock or threading.Lock()
+
+    @staticmethod
+    def load_model(prototxt_path=None, model_path=None):
+        prototxt_path = prototxt_path or os.path.join(MODELS_DIR, "deploy.prototxt")
+        model_path = model_path or os.path.join(MODELS_DIR, "res10_300x300_ssd_iter_140000.caffemodel")
+        for path in (prototxt_path, model_path):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"SSD face detector file '{path}' not found.")
+        return cv2.dnn.readNetFromCaffe(prototxt_path, model_path)
+
+    def detect_faces(self, img_array):
+        h_img, w_img = img_array.shape[:2]
+        blob = cv2.dnn.blobFromImage(cv2.resize(img_array, self.INPUT_SIZE), 1.0, self.INPUT_SIZE, self.MEAN)
+        with self.model_lock: # setInput + forward must not interleave with another thread's call
+            self.model.setInput(blob)
+            detections = self.model.forward()
+        results = []
+        for i in range(detections.shape[2]):
+            confidence = float(detections[0, 0, i, 2])
+            if confidence <= 0:
+                continue
+            x1, y1, x2, y2 = (detections[0, 0, i, 3:7] * [w_img, h_img, w_img, h_img]).astype(int)
+            results.append({'box': [int(x1), int(y1), int(x2 - x1), int(y2 - y1)], 'confidence': confidence, 'keypoints': {}})
+        return results
+
+
+class UltraFaceDetector:
+    """
+    Ultra-Light-Fast-Generic-Face-Detector (version-RFB-320.onnx) on ONNX Runtime. About 1 MB and very
+    fast on ARM CPUs, no landmarks. intra_op_threads sets the session's thread count.
+    """
+    backend = "ultraface"
+    uses_model_lock = False # ONNX Runtime's run() is thread-safe
+    model_options = ("model_path", "intra_op_threads")
+    SCORE_FLOOR = 0.3 # Keep candidates above this; stages filter by their own min_confidence
+
+    def __init__(self, model, min_confidence=0.7, nms_threshold=0.3):
+        self.model = model
+        self.min_confidence = min_confidence
+        self.nms_threshold = nms_threshold
+        model_input = model.get_inputs()[0]
+        self._input_name = model_input.name
+        self._input_size = (model_input.shape[3], model_input.shape[2]) # NCHW -> (width, height)
+
+    @staticmethod
+    def load_model(model_path=None, intra_op_threads=None):
+        model_path = model_path or os.path.join(MODELS_DIR, "version-RFB-320.onnx")
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"UltraFace model '{model_path}' not found.")
+        return get_onnx_session(model_path, intra_op_threads)
+
+    def detect_faces(self, img_array):
+        h_img, w_img = img_array.shape[:2]
+        rgb = cv2.cvtColor(cv2.resize(img_array, self._input_size), cv2.COLOR_BGR2RGB).astype(np.float32)
+        blob = ((rgb - 127.0) / 128.0).transpose(2, 0, 1)[np.newaxis]
+        scores, boxes = self.model.run(None, {self._input_name: blob})
+        scores, boxes = scores[0, :, 1], boxes[0]
+        candidates = scores >= self.SCORE_FLOOR
+        scores = scores[candidates]
+        # Boxes are normalized corners; convert to pixel [x, y, w, h]
+        corners = boxes[candidates] * [w_img, h_img, w_img, h_img]
+        rects = [[int(x1), int(y1), int(x2 - x1), int(y2 - y1)] for x1, y1, x2, y2 in corners]
+        keep = cv2.dnn.NMSBoxes(rects, scores.tolist(), self.SCORE_FLOOR, self.nms_threshold) if rects else []
+        return [{'box': rects[i], 'confidence': float(scores[i]), 'keypoints': {}} for i in np.array(keep).flatten()]
+
+
+DETECTOR_BACKENDS = {cls.backend: cls for cls in (HaarFaceDetector, MtcnnFaceDetector, YuNetFaceDetector, SsdFaceDetector, UltraFaceDetector)}
+
+
+def create_detector(spec, model_cache=None):
+    """
+    Builds a detector from a spec: a backend name ("haar", "mtcnn", "yunet", "ssd", "ultraface") or a dict such as
+    {"backend": "mtcnn", "min_confidence": 0.97}. Model options (e.g. model_path) select the model files,
+    the remaining keys are passed to the detector. Models are shared through model_cache, if given.
+    Stateful OpenCV models (detectors taking a model_lock) also share one lock per model, because the
+    preview, recognition and training threads may call the same model at once.
+    """
+    options = {"backend": spec} if isinstance(spec, str) else dict(spec)
+    backend = options.pop("backend", None)
+    if backend not in DETECTOR_BACKENDS:
+        raise ValueError(f"Unknown face detector backend '{backend}'. Available: {', '.join(DETECTOR_BACKENDS)}")
+    detector_class = DETECTOR_BACKENDS[backend]
+
+    model_kwargs = {name: options.pop(name) for name in detector_class.model_options if name in options}
+    model_key = (backend, tuple(sorted(model_kwargs.items())))
+    if model_cache is not None and model_key in model_cache:
+        model, model_lock = model_cache[model_key]
+    else:
+        model, model_lock = detector_class.load_model(**model_kwargs), threading.Lock()
+        if model_cache is not None:
+            model_cache[model_key] = (model, model_lock)
+    if detector_class.uses_model_lock:
+        options["model_lock"] = model_lock
+    return detector_class(model, **options)
+
+
+def create_stage_detectors(config, default_specs):
+    """
+    Builds one detector per pipeline stage (e.g. "preview", "recognition", "training").
+    The spec for a stage comes from config["detectors"][stage], or default_specs[stage] if the config
+    does not set one. A configured backend that fails to load falls back to the default spec, and a
+    stage whose detector cannot be loaded at all maps to None. Stages with the same model share it.
+    """
+    configured = config.get("detectors", {})
+    model_cache = {}
+    detectors = {}
+    for stage, default_spec in default_specs.items():
+        spec = configured.get(stage, default_spec)
+        detectors[stage] = None
+        for candidate in ([spec, default_spec] if spec != default_spec else [spec]):
+            try:
+                detectors[stage] = create_detector(candidate, model_cache)
+                print(f"Face detector for {stage}: {detectors[stage].backend}")
+                break
+            except Exception as e:
+                print(f"Warning: Could not load the {stage} face detector {candidate}: {e}")
+    return detectors
+
+
+def same_detector_model(detector_a, detector_b):
+    """True if two stage detectors run the same model, so one stage's boxes can be reused by the other."""
+    return detector_a is not None and detector_b is not None and detector_a.model is detector_b.model
+
+
+# === Face Tracking Between Detections ===
+# OpenCV tracker factories in order of preference. Only the correlation-filter trackers (KCF, MOSSE) are
+# cheap enough to run between detections, and they need opencv-contrib-python. The MIL tracker in the
+# main package is deliberately left out: it costs about as much as a Haar detection and keeps reporting
+# success after the face has left the frame.
+TRACKER_FACTORIES = ("TrackerKCF_create", "legacy.TrackerKCF_create", "legacy.TrackerMOSSE_create")
+
+
+def _tracker_factories():
+    for factory in TRACKER_FACTORIES:
+        owner, _, name = factory.rpartition(".")
+        module = getattr(cv2, owner, None) if owner else cv2
+        create = getattr(module, name, None) if module is not None else None
+        if create is not None:
+            yield create
+
+
+def opencv_tracker_available():
+    """True if this OpenCV build provides one of TRACKER_FACTORIES."""
+    return next(_tracker_factories(), None) is not None
+
+
+def create_opencv_tracker():
+    """Returns a new cheap OpenCV single-object tracker, or None if this OpenCV build has none."""
+    for create in _tracker_factories():
+        try:
+            return create()
+        except cv2.error:
+            continue
+    return None
+
+
+class FaceTracker:
+    """
+    Follows the last detected face across frames with a cheap OpenCV tracker, so a full detection is
+    only needed periodically or when tracking is lost. The tracker runs on a copy downscaled to
+    max_side and reports boxes in the source frame's coordinates.
+
+    update() returns (face_info, lost):
+      (detection, False) - the face was followed; detection is in the MTCNN result format
+      (None, True)       - tracking failed or the box drifted implausibly; re-detect now
+      (None, False)      - nothing is being tracked
+    """
+
+    def __init__(self, max_side=None, max_scale_change=1.5):
+        self.max_side = max_side
+        self.max_scale_change = max_scale_change
+        self._tracker = None
+        self._face_info = None
+        self._scale = 1.0
+
+    @property
+    def active(self):
+        return self._tracker is not None
+
+    def reset(self):
+        self._tracker = None
+        self._face_info = None
+
+    def start(self, frame, face_info):
+        """(Re)initializes tracking on a fresh detection. Returns False if no tracker is available."""
+        tracker = create_opencv_tracker()
+        if tracker is None:
+            self.reset()
+            return False
+        small, scale = downscale_image(frame, self.max_side)
+        x, y, w, h = scale_face(face_info, scale)['box']
+        try:
+            tracker.init(small, (x, y, max(1, w), max(1, h)))
+        except cv2.error as e:
+            print(f"Face tracker: Could not initialize tracker: {e}")
+            self.reset()
+            return False
+        self._tracker = tracker
+        self._face_info = face_info
+        self._scale = scale
+        return True
+
+    def update(self, frame):
+        if self._tracker is None:
+            return None, False
+        small, _ = downscale_image(frame, self.max_side)
+        try:
+            ok, box = self._tracker.update(small)
+        except cv2.error:
+            ok = False
+        if not ok:
+            self.reset()
+            return None, True
+
+        tracked = scale_face({'box': list(box), 'confidence': self._face_info['confidence']}, 1.0 / self._scale)
+        if self._drifted(frame, tracked):
+            self.reset()
+            return None, True
+        self._face_info = tracked
+        return tracked, False
+
+    def _drifted(self, frame, tracked):
+        """True if the tracked box left the frame, jumped, or changed size too much since the last update."""
+        h_img, w_img = frame.shape[:2]
+        x, y, w, h = tracked['box']
+        if w <= 0 or h <= 0 or x + w <= 0 or y + h <= 0 or x >= w_img or y >= h_img:
+            return True
+        last_x, last_y, last_w, last_h = self._face_info['box']
+        scale_change = (w * h) / max(1, last_w * last_h)
+        if not (1 / self.max_scale_change ** 2) <= scale_change <= self.max_scale_change ** 2:
+            return True
+        center_shift = abs((x + w / 2) - (last_x + last_w / 2)) + abs((y + h / 2) - (last_y + last_h / 2))
+        return center_shift > max(last_w, last_h)
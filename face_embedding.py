@@ -0,0 +1,196 @@
+import os
+import threading
+import numpy as np
+from onnx_sessions import get_onnx_session
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.join(BASE_DIR, "Code", "models")
+# Written by package_models.py
+FACENET_SAVEDMODEL_DIR = os.path.join(MODELS_DIR, "facenet_savedmodel")
+FACENET_INPUT_SHAPE = (160, 160, 3)
+# ONNX conversion of it (see package_models.py --only onnx)
+FACENET_ONNX_FILE = os.path.join(MODELS_DIR, "facenet.onnx")
+# TFLite conversions of it, one per quantization (see package_models.py --only tflite)
+FACENET_TFLITE_FILES = {
+    "float32": os.path.join(MODELS_DIR, "facenet.tflite"),
+    "float16": os.path.join(MODELS_DIR, "facenet_float16.tflite"), # Half the size, near-identical embeddings
+    "dynamic": os.path.join(MODELS_DIR, "facenet_dynamic.tflite"), # int8 weights, float activations
+    "int8": os.path.join(MODELS_DIR, "facenet_int8.tflite"),       # int8 weights and activations, calibrated on dataset/
+}
+
+
+# === Embedding Results ===
+# Every embedder has embeddings(images): a list or array of 160x160 face crops in, one row per face out,
+# computed the way keras_facenet's FaceNet.embeddings does it so stored embeddings stay comparable.
+
+def prewhiten(images):
+    """Per-image standardization applied by keras_facenet before the network (std floored for flat images)."""
+    images = np.asarray(images, dtype=np.float32)
+    axes = tuple(range(1, images.ndim))
+    mean = images.mean(axis=axes, keepdims=True)
+    std = images.std(axis=axes, keepdims=True)
+    std = np.maximum(std, 1.0 / np.sqrt(images[0].size))
+    return (images - mean) / std
+
+
+# === Embedding Backends ===
+class KerasFaceNetEmbedder:
+    """keras_facenet's FaceNet. Rebuilds the Keras model and resolves its weights (download cache) on every start."""
+    backend = "keras"
+    model_options = ()
+
+    def __init__(self, model):
+        self.model = model
+
+    @staticmethod
+    def load_model():
+        from keras_facenet import FaceNet
+        return FaceNet()
+
+    def embeddings(self, images):
+        return self.model.embeddings(images)
+
+
+class SavedModelFaceNetEmbedder:
+    """The same network pre-serialized by package_models.py. Loads from the project tree, never touches the network."""
+    backend = "savedmodel"
+    model_options = ("model_dir",)
+
+    def __init__(self, model):
+        self.model = model
+
+    @staticmethod
+    def load_model(model_dir=None):
+        model_dir = model_dir or FACENET_SAVEDMODEL_DIR
+        if not os.path.exists(os.path.join(model_dir, "saved_model.pb")):
+            raise FileNotFoundError(f"FaceNet artifact '{model_dir}' not found. Run 'python package_models.py' once.")
+        import tensorflow as tf
+        return tf.saved_model.load(model_dir)
+
+    def embeddings(self, images):
+        return self.model.serve(prewhiten(images)).numpy()
+
+
+def load_tflite_interpreter(model_path, num_threads):
+    """Uses the small tflite_runtime package if installed, else TensorFlow's bundled interpreter."""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    # The default op resolver applies the XNNPACK delegate to float models; num_threads is its thread pool size
+    return Interpreter(model_path=model_path, num_threads=num_threads)
+
+
+class TfliteFaceNetEmbedder:
+    """
+    A TFLite conversion of FaceNet (float32, float16, dynamic-range or int8) run by the TFLite interpreter
+    with XNNPACK. Much smaller in memory than the Keras model and faster per face on the Pi's CPU.
+    The interpreter is not thread-safe, so calls from the recognition and training threads take turns.
+    """
+    backend = "tflite"
+    model_options = ("quantization", "model_path", "num_threads")
+
+    def __init__(self, model):
+        self.model = model
+        self._lock = threading.Lock()
+        self._batch_size = None
+        input_details = model.get_input_details()[0]
+        self._input_index = input_details["index"]
+        self._input_dtype = input_details["dtype"]
+        self._input_quantization = input_details["quantization"]
+        output_details = model.get_output_details()[0]
+        self._output_index = output_details["index"]
+        self._output_quantization = output_details["quantization"]
+
+    @staticmethod
+    def load_model(quantization="float16", model_path=None, num_threads=None):
+        if model_path is None:
+            if quantization not in FACENET_TFLITE_FILES:
+                raise ValueError(f"Unknown TFLite quantization '{quantization}'. Available: {', '.join(FACENET_TFLITE_FILES)}")
+            model_path = FACENET_TFLITE_FILES[quantization]
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"TFLite FaceNet '{model_path}' not found. Run 'python package_models.py --only tflite'.")
+        interpreter = load_tflite_interpreter(model_path, num_threads or os.cpu_count() or 1)
+        interpreter.allocate_tensors()
+        return interpreter
+
+    def embeddings(self, images):
+        batch = prewhiten(images)
+        with self._lock:
+            if batch.shape[0] != self._batch_size:
+                # Tensors are only reallocated when the batch size changes (1 for recognition)
+                self.model.resize_tensor_input(self._input_index, batch.shape)
+                self.model.allocate_tensors()
+                self._batch_size = batch.shape[0]
+            if self._input_dtype != np.float32:
+                scale, zero_point = self._input_quantization
+                info = np.iinfo(self._input_dtype)
+                batch = np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(self._input_dtype)
+            self.model.set_tensor(self._input_index, batch)
+            self.model.invoke()
+            output = self.model.get_tensor(self._output_index)
+        if output.dtype != np.float32:
+            scale, zero_point = self._output_quantization
+            return (output.astype(np.float32) - zero_point) * scale
+        return output
+
+
+class OnnxFaceNetEmbedder:
+    """
+    An ONNX conversion of FaceNet on ONNX Runtime's CPU provider. No TensorFlow in the process at all;
+    intra_op_threads sets the session's thread count. The session is shared and safe to use from any thread.
+    """
+    backend = "onnx"
+    model_options = ("model_path", "intra_op_threads")
+
+    def __init__(self, model):
+        self.model = model
+        self._input_name = model.get_inputs()[0].name
+
+    @staticmethod
+    def load_model(model_path=None, intra_op_threads=None):
+        model_path = model_path or FACENET_ONNX_FILE
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"ONNX FaceNet '{model_path}' not found. Run 'python package_models.py --only onnx'.")
+        return get_onnx_session(model_path, intra_op_threads)
+
+    def embeddings(self, images):
+        return self.model.run(None, {self._input_name: prewhiten(images)})[0]
+
+
+EMBEDDER_BACKENDS = {cls.backend: cls for cls in (KerasFaceNetEmbedder, SavedModelFaceNetEmbedder, TfliteFaceNetEmbedder, OnnxFaceNetEmbedder)}
+
+# Tried in order after the configured embedder: the packaged artifact if it exists, else keras_facenet
+DEFAULT_EMBEDDER_SPECS = ("savedmodel", "keras")
+
+
+def create_embedder(spec):
+    """
+    Builds an embedder from a spec: a backend name ("keras", "savedmodel", "tflite", "onnx") or a dict such as
+    {"backend": "tflite", "quantization": "float16", "num_threads": 4}. Model options select the model files.
+    """
+    options = {"backend": spec} if isinstance(spec, str) else dict(spec)
+    backend = options.pop("backend", None)
+    if backend not in EMBEDDER_BACKENDS:
+        raise ValueError(f"Unknown face embedder backend '{backend}'. Available: {', '.join(EMBEDDER_BACKENDS)}")
+    embedder_class = EMBEDDER_BACKENDS[backend]
+    model_kwargs = {name: options.pop(name) for name in embedder_class.model_options if name in options}
+    return embedder_class(embedder_class.load_model(**model_kwargs), **options)
+
+
+def create_configured_embedder(config, default_specs=DEFAULT_EMBEDDER_SPECS):
+    """
+    Builds the embedder set by config["embedder"], falling back to default_specs in order.
+    Returns None if no embedder can be loaded.
+    """
+    candidates = [config["embedder"]] if "embedder" in config else []
+    candidates += [spec for spec in default_specs if spec not in candidates]
+    for spec in candidates:
+        try:
+            embedder = create_embedder(spec)
+            print(f"Face embedder: {embedder.backend}")
+            return embedder
+        except Exception as e:
+            print(f"Warning: Could not load the face embedder {spec}: {e}")
+    return None
@@ -0,0 +1,82 @@
+import threading
+import time
+
+# === Engine States ===
+ENGINE_LOADING = "loading"
+ENGINE_WARMING = "warming up"
+ENGINE_READY = "ready"
+ENGINE_FAILED = "failed"
+
+
+class ModelEngine:
+    """
+    Loads the face models on a background thread so the UI can start before TensorFlow is up.
+
+    load() does the actual work (importing the libraries and building the models) and may call
+    set_stage(text) to describe what it is doing for the UI. If given, warm_up() then runs the loaded
+    models once on dummy inputs so the first real request does not pay tracing and allocation costs;
+    a failing warm-up is only reported. The engine goes from ENGINE_LOADING through ENGINE_WARMING to
+    ENGINE_READY, or to ENGINE_FAILED if load() raises; either way it is finished and wait_ready()
+    returns, so callers can fall back to their degraded paths instead of hanging.
+    """
+
+    def __init__(self, load, warm_up=None, name="Face models"):
+        self.load = load
+        self.warm_up = warm_up
+        self.name = name
+        self.state = ENGINE_LOADING
+        self.stage = "Starting"
+        self.error = None
+        self.load_time = None
+        self.warm_up_time = None
+        self._finished = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def set_stage(self, text):
+        self.stage = text
+        print(f"{self.name}: {text}...")
+
+    @property
+    def is_ready(self):
+        return self.state == ENGINE_READY
+
+    @property
+    def is_finished(self):
+        return self._finished.is_set()
+
+    def wait_ready(self, timeout=None):
+        """Blocks until loading has finished. Returns True only if the models loaded successfully."""
+        self._finished.wait(timeout)
+        return self.is_ready
+
+    def _run(self):
+        start_time = time.perf_counter()
+        try:
+            self.load()
+        except Exception as e:
+            print(f"{self.name}: Loading failed: {e}")
+            self.error = e
+            self.state = ENGINE_FAILED
+        self.load_time = time.perf_counter() - start_time
+
+        if self.state != ENGINE_FAILED and self.warm_up is not None:
+            self.state = ENGINE_WARMING
+            self.set_stage("Warming up")
+            warm_up_start = time.perf_counter()
+            try:
+                self.warm_up()
+            except Exception as e:
+                print(f"{self.name}: Warm-up failed, the first request will be slower: {e}")
+            self.warm_up_time = time.perf_counter() - warm_up_start
+            print(f"{self.name}: Warm-up took {self.warm_up_time:.1f} s.")
+
+        if self.state != ENGINE_FAILED:
+            self.state = ENGINE_READY
+        print(f"{self.name}: {self.state} after {time.perf_counter() - start_time:.1f} s.")
+        self._finished.set()
@@ -0,0 +1,36 @@
+import os
+import threading
+
+# Intra-op threads for sessions that do not ask for a number (None lets ONNX Runtime use every core).
+# train.py's detection workers lower it to 1, like they do for TensorFlow and OpenCV.
+default_intra_op_threads = None
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def limit_onnx_threads(intra_op_threads):
+    """Sets the intra-op thread count for sessions created from now on without an explicit count."""
+    global default_intra_op_threads
+    default_intra_op_threads = intra_op_threads
+
+
+def get_onnx_session(model_path, intra_op_threads=None):
+    """
+    Returns an ONNX Runtime CPU session for model_path. Sessions are created once per (model, threads)
+    and reused, so stages and the training thread sharing a model also share its session; run() is
+    safe to call from several threads.
+    """
+    intra_op_threads = intra_op_threads or default_intra_op_threads or 0
+    key = (os.path.abspath(model_path), intra_op_threads)
+    with _sessions_lock:
+        if key not in _sessions:
+            import onnxruntime as ort
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = intra_op_threads # 0 = ONNX Runtime's default (one per core)
+            options.inter_op_num_threads = 1 # The models here are single chains; parallel ops would only add threads
+            options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            _sessions[key] = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+            print(f"ONNX Runtime session: {os.path.basename(model_path)}, intra-op threads {intra_op_threads or 'default'}")
+        return _sessions[key]
@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+from face_detection import MODELS_DIR, MTCNN_WEIGHTS_FILE, DETECTOR_BACKENDS, create_detector, detect_faces_downscaled
+from face_embedding import (FACENET_SAVEDMODEL_DIR, FACENET_INPUT_SHAPE, FACENET_TFLITE_FILES, FACENET_ONNX_FILE,
+                            KerasFaceNetEmbedder, SavedModelFaceNetEmbedder, TfliteFaceNetEmbedder, OnnxFaceNetEmbedder,
+                            create_embedder, prewhiten)
+
+# Largest absolute difference allowed between Keras and packaged FaceNet embeddings
+PARITY_TOLERANCE = 1e-4
+PARITY_SAMPLES = 8
+
+# Lowest cosine similarity allowed between Keras and converted (TFLite, ONNX) embeddings of the same dataset/ face.
+# Quantized models drift a little; what matters is that they stay far above RECOGNITION_THRESHOLD's margin.
+MIN_EMBEDDING_SIMILARITY = 0.99
+# ONNX opset for the FaceNet conversion
+ONNX_OPSET = 13
+# Detection runs on a copy downscaled to this longest side, as in train.py and the UIs
+BENCHMARK_DETECTION_MAX_SIDE = 640
+# Number of dataset/ faces used to calibrate the int8 activations
+TFLITE_CALIBRATION_SAMPLES = 100
+
+def package_facenet(output_dir=FACENET_SAVEDMODEL_DIR):
+    """
+    Builds keras_facenet's FaceNet once (this needs its weights, downloaded or already cached) and saves
+    the network as a SavedModel with a fixed serve(images) signature, plus a manifest.json describing it.
+    The UI and train.py then load it with SavedModelFaceNetEmbedder instead of rebuilding the Keras model.
+    Returns the Keras embedder so the artifact can be checked against it.
+    """
+    import tensorflow as tf
+    keras_embedder = KerasFaceNetEmbedder(KerasFaceNetEmbedder.load_model())
+    network = keras_embedder.model.model
+
+    module = tf.Module()
+    module.network = network
+    module.serve = tf.function(lambda images: network(images, training=False),
+                               input_signature=[tf.TensorSpec((None,) + FACENET_INPUT_SHAPE, tf.float32)])
+
+    # Write next to the old artifact and swap, so an interrupted run never leaves a broken model behind
+    temp_dir = output_dir + ".tmp"
+    if os.path.exists(temp_dir):
+        shutil.rmtree(temp_dir)
+    # The serving signature lets the TFLite converter start from this artifact
+    tf.saved_model.save(module, temp_dir, signatures={"serving_default": module.serve.get_concrete_function()})
+    manifest = {
+        "source": "keras_facenet",
+        "input_shape": list(FACENET_INPUT_SHAPE),
+        "embedding_size": int(network.output_shape[-1]),
+        "tensorflow_version": tf.__version__,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    with open(os.path.join(temp_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    if os.path.exists(output_dir):
+        shutil.rmtree(output_dir)
+    os.replace(temp_dir, output_dir)
+    print(f"FaceNet saved to {output_dir}")
+    return keras_embedder
+
+def check_facenet_parity(keras_embedder, model_dir=FACENET_SAVEDMODEL_DIR, samples=PARITY_SAMPLES):
+    """Embeds the same random face crops with Keras and the packaged model. Returns the largest difference."""
+    faces = np.random.default_rng(0).integers(0, 256, (samples,) + FACENET_INPUT_SHAPE, dtype=np.uint8)
+    packaged_embedder = SavedModelFaceNetEmbedder(SavedModelFaceNetEmbedder.load_model(model_dir))
+    difference = np.abs(np.asarray(keras_embedder.embeddings(faces)) - packaged_embedder.embeddings(faces)).max()
+    print(f"FaceNet parity: max abs difference {difference:.2e} over {samples} faces")
+    return float(difference)
+
+def dataset_image_paths():
+    import train
+    img_paths = []
+    for person_name in sorted(os.listdir(train.dataset_path)):
+        if os.path.isdir(os.path.join(train.dataset_path, person_name)):
+            img_paths.extend(train.list_locker_images(person_name))
+    return img_paths
+
+def dataset_faces():
+    """Crops the faces of every dataset/ image the way train.py does, for int8 calibration and parity checks."""
+    import train
+    detector = train.create_training_detector()
+    if detector is None:
+        raise RuntimeError("No face detector could be loaded to crop dataset/ faces.")
+    train.use_models(None, detector)
+    faces = [face for face in (train.extract_face(img_path) for img_path in dataset_image_paths()) if face is not None]
+    print(f"Cropped {len(faces)} faces from dataset/")
+    return faces
+
+def package_facenet_tflite(quantization, faces, saved_model_dir=FACENET_SAVEDMODEL_DIR):
+    """
+    Converts the packaged FaceNet SavedModel to TFLite. "float16" halves the weights, "dynamic" stores them
+    as int8, "int8" also runs the activations in int8, calibrated on the given dataset/ faces.
+    """
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+    if quantization != "float32":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == "int8":
+        if not faces:
+            raise RuntimeError("int8 quantization needs dataset/ faces for calibration.")
+
+        def representative_dataset():
+            for face in faces[:TFLITE_CALIBRATION_SAMPLES]:
+                yield [prewhiten([face])]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    model_path = FACENET_TFLITE_FILES[quantization]
+    with open(model_path, "wb") as f:
+        f.write(converter.convert())
+    print(f"FaceNet ({quantization}) saved to {model_path}, {os.path.getsize(model_path) / 1e6:.1f} MB")
+    return model_path
+
+def compare_embedders(reference, candidate, faces):
+    """
+    Embeds each face one at a time (as recognition does) with both embedders.
+    Returns (lowest cosine similarity, mean cosine similarity, reference ms/face, candidate ms/face).
+    """
+    timings = []
+    outputs = []
+    for embedder in (reference, candidate):
+        embedder.embeddings(faces[:1]) # Warm-up, not timed
+        start_time = time.perf_counter()
+        outputs.append(np.concatenate([np.asarray(embedder.embeddings([face]), dtype=np.float32) for face in faces]))
+        timings.append((time.perf_counter() - start_time) * 1000 / len(faces))
+    reference_embeddings, candidate_embeddings = (e / np.linalg.norm(e, axis=1, keepdims=True) for e in outputs)
+    similarities = np.sum(reference_embeddings * candidate_embeddings, axis=1)
+    return float(similarities.min()), float(similarities.mean()), timings[0], timings[1]
+
+def check_embedder_parity(keras_embedder, candidate, label, faces, min_similarity=MIN_EMBEDDING_SIMILARITY):
+    """Compares a converted model with Keras on the dataset/ faces and prints similarity and latency."""
+    lowest, mean, keras_ms, candidate_ms = compare_embedders(keras_embedder, candidate, faces)
+    print(f"{label} vs Keras on {len(faces)} dataset/ faces: cosine similarity min {lowest:.4f}, mean {mean:.4f}")
+    print(f"Per-face embedding: Keras {keras_ms:.1f} ms, {label} {candidate_ms:.1f} ms")
+    return lowest >= min_similarity
+
+def package_facenet_onnx(keras_embedder, output_path=FACENET_ONNX_FILE, opset=ONNX_OPSET):
+    """Converts keras_facenet's network to ONNX with tf2onnx, keeping a dynamic batch dimension."""
+    import tensorflow as tf
+    import tf2onnx
+    input_signature = (tf.TensorSpec((None,) + FACENET_INPUT_SHAPE, tf.float32, name="images"),)
+    tf2onnx.convert.from_keras(keras_embedder.model.model, input_signature=input_signature, opset=opset, output_path=output_path)
+    print(f"FaceNet (ONNX opset {opset}) saved to {output_path}, {os.path.getsize(output_path) / 1e6:.1f} MB")
+    return output_path
+
+def benchmark_backends(faces, img_paths, embedder_specs, detector_specs):
+    """
+    Times every embedder and detector spec that loads on this device: per-face embedding on the dataset/
+    crops and per-image detection on the dataset/ images. Specs that fail to load are reported and skipped.
+    Put the fastest ones in pipeline_config.json ("embedder", "detectors").
+    """
+    import cv2
+    images = [img for img in (cv2.imread(path) for path in img_paths) if img is not None]
+    if not faces or not images:
+        print("No dataset/ images with faces to benchmark on.")
+        return
+    for spec in embedder_specs:
+        try:
+            embedder = create_embedder(spec)
+        except Exception as e:
+            print(f"Embedder {spec}: not available ({e})")
+            continue
+        embedder.embeddings(faces[:1]) # Warm-up, not timed
+        start_time = time.perf_counter()
+        for face in faces:
+            embedder.embeddings([face])
+        print(f"Embedder {spec}: {(time.perf_counter() - start_time) * 1000 / len(faces):.1f} ms/face")
+    for spec in detector_specs:
+        try:
+            detector = create_detector(spec)
+        except Exception as e:
+            print(f"Detector {spec}: not available ({e})")
+            continue
+        detect_faces_downscaled(detector, images[0], BENCHMARK_DETECTION_MAX_SIDE) # Warm-up, not timed
+        start_time = time.perf_counter()
+        for img in images:
+            detect_faces_downscaled(detector, img, BENCHMARK_DETECTION_MAX_SIDE)
+        print(f"Detector {spec}: {(time.perf_counter() - start_time) * 1000 / len(images):.1f} ms/image")
+
+def package_mtcnn(weights_file=MTCNN_WEIGHTS_FILE):
+    """
+    Copies the installed mtcnn package's weights into the project tree, so detectors load pinned weights.
+    Returns False if this mtcnn version does not ship a separate weights file.
+    """
+    import mtcnn
+    source = os.path.join(os.path.dirname(mtcnn.__file__), "data", "mtcnn_weights.npy")
+    if not os.path.exists(source):
+        print("This mtcnn version keeps its weights inside the package; it already loads without network access.")
+        return False
+    shutil.copyfile(source, weights_file)
+    print(f"MTCNN weights saved to {weights_file}")
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write pre-serialized FaceNet and MTCNN artifacts into Code/models for offline start-up.")
+    parser.add_argument("--only", choices=("facenet", "mtcnn", "tflite", "onnx"),
+                        help="Package only one of the models. 'tflite' and 'onnx' convert FaceNet (not done by default).")
+    parser.add_argument("--quantization", choices=tuple(FACENET_TFLITE_FILES), default="float16",
+                        help="TFLite quantization (default: float16).")
+    parser.add_argument("--threads", type=int, default=None, help="TFLite/ONNX Runtime threads for the parity check (default: all cores).")
+    parser.add_argument("--min-similarity", type=float, default=MIN_EMBEDDING_SIMILARITY,
+                        help=f"Lowest Keras/converted cosine similarity accepted on dataset/ (default: {MIN_EMBEDDING_SIMILARITY}).")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Package nothing; time every embedder and detector backend available on this device on dataset/.")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        embedder_specs = ["keras", "savedmodel"]
+        embedder_specs += [{"backend": "tflite", "quantization": q, "num_threads": args.threads} for q in FACENET_TFLITE_FILES]
+        embedder_specs += [{"backend": "onnx", "intra_op_threads": args.threads}]
+        benchmark_backends(dataset_faces(), dataset_image_paths(), embedder_specs, list(DETECTOR_BACKENDS))
+        raise SystemExit(0)
+
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    if args.only in ("tflite", "onnx"):
+        if args.only == "onnx" or os.path.exists(FACENET_SAVEDMODEL_DIR):
+            keras_embedder = KerasFaceNetEmbedder(KerasFaceNetEmbedder.load_model())
+        else:
+            keras_embedder = package_facenet()
+        faces = dataset_faces()
+        if args.only == "tflite":
+            label = f"TFLite ({args.quantization})"
+            model_path = package_facenet_tflite(args.quantization, faces)
+            load_converted = lambda: TfliteFaceNetEmbedder(TfliteFaceNetEmbedder.load_model(args.quantization, num_threads=args.threads))
+        else:
+            label = "ONNX"
+            model_path = package_facenet_onnx(keras_embedder)
+            load_converted = lambda: OnnxFaceNetEmbedder(OnnxFaceNetEmbedder.load_model(intra_op_threads=args.threads))
+        if not faces:
+            print(f"Warning: No dataset/ faces found; the {label} model was not checked against Keras.")
+        elif not check_embedder_parity(keras_embedder, load_converted(), label, faces, args.min_similarity):
+            os.remove(model_path)
+            raise SystemExit(f"Error: {label} embeddings are below {args.min_similarity} similarity; model removed.")
+    if args.only in (None, "mtcnn"):
+        package_mtcnn()
+    if args.only in (None, "facenet"):
+        keras_embedder = package_facenet()
+        if check_facenet_parity(keras_embedder) > PARITY_TOLERANCE:
+            # Stored embeddings were made with Keras, so a model that disagrees must not be picked up
+            shutil.rmtree(FACENET_SAVEDMODEL_DIR)
+            raise SystemExit(f"Error: Packaged FaceNet differs from Keras by more than {PARITY_TOLERANCE}; artifact removed.")
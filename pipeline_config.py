@@ -0,0 +1,32 @@
+import os
+import json
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Deployment settings shared by ui.py, uimtcnn.py and train.py. Every key is optional; a missing
+# file or key keeps each script's built-in default. 'python package_models.py --benchmark' times the
+# detector and embedder backends available on a device, to pick the fastest ones here. Example:
+#   {
+#     "detectors": {
+#       "preview": {"backend": "ultraface", "min_confidence": 0.7, "intra_op_threads": 2},
+#       "recognition": {"backend": "mtcnn", "min_confidence": 0.97},
+#       "training": "mtcnn"
+#     },
+#     "embedder": {"backend": "tflite", "quantization": "float16", "num_threads": 4}
+#   }
+PIPELINE_CONFIG_FILE = os.path.join(BASE_DIR, "pipeline_config.json")
+
+
+def load_pipeline_config(path=PIPELINE_CONFIG_FILE):
+    """Returns the settings in pipeline_config.json as a dict ({} if the file is missing or unreadable)."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            config = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read pipeline config '{path}': {e}. Using defaults.")
+        return {}
+    if not isinstance(config, dict):
+        print(f"Warning: Pipeline config '{path}' is not a JSON object. Using defaults.")
+        return {}
+    return config
@@ -0,0 +1,168 @@
+import time
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+from camera_pipeline import compute_display_crop
+
+
+# === Border Guide Overlay ===
+def draw_rounded_corners_with_lines(image, p1, p2, color, thickness, r, line_length):
+    x1, y1 = p1
+    x2, y2 = p2
+
+    cv2.ellipse(image, (x1 + r, y1 + r), (r, r), 180, 0, 90, color, thickness)
+    cv2.ellipse(image, (x2 - r, y1 + r), (r, r), 270, 0, 90, color, thickness)
+    cv2.ellipse(image, (x1 + r, y2 - r), (r, r), 90, 0, 90, color, thickness)
+    cv2.ellipse(image, (x2 - r, y2 - r), (r, r), 0, 0, 90, color, thickness)
+
+    cv2.line(image, (x1 + r, y1), (x1 + r + line_length, y1), color, thickness)
+    cv2.line(image, (x2 - r, y1), (x2 - r - line_length, y1), color, thickness)
+
+    cv2.line(image, (x1 + r, y2), (x1 + r + line_length, y2), color, thickness)
+    cv2.line(image, (x2 - r, y2), (x2 - r - line_length, y2), color, thickness)
+
+    cv2.line(image, (x1, y1 + r), (x1, y1 + r + line_length), color, thickness)
+    cv2.line(image, (x1, y2 - r), (x1, y2 - r - line_length), color, thickness)
+
+    cv2.line(image, (x2, y1 + r), (x2, y1 + r + line_length), color, thickness)
+    cv2.line(image, (x2, y2 - r), (x2, y2 - r - line_length), color, thickness)
+
+
+class GuideOverlay:
+    """
+    The rounded border guide, drawn once per display size into a mask and composited onto every frame
+    by writing the guide color into the masked pixels with a single vectorized assignment.
+    Thickness, corner radius and line length are given in camera pixels and scaled to the display.
+    Instances can be passed to PreviewRenderer as its decorate callback.
+    """
+
+    def __init__(self, color, thickness, radius, line_length, width_ratio, height_ratio):
+        self.color = np.array(color, dtype=np.uint8)
+        self.thickness = thickness
+        self.radius = radius
+        self.line_length = line_length
+        self.width_ratio = width_ratio
+        self.height_ratio = height_ratio
+        self._key = None
+        self._rows = None
+        self._cols = None
+
+    def _render(self, image_h, image_w, scale):
+        border_w = int(image_w * self.width_ratio)
+        border_h = int(image_h * self.height_ratio)
+        border_x1 = (image_w - border_w) // 2
+        border_y1 = (image_h - border_h) // 2
+        border_x2 = border_x1 + border_w
+        border_y2 = border_y1 + border_h
+
+        mask = np.zeros((image_h, image_w), dtype=np.uint8)
+        draw_rounded_corners_with_lines(mask, (border_x1, border_y1), (border_x2, border_y2), 255,
+                                        max(1, int(round(self.thickness * scale))), int(round(self.radius * scale)),
+                                        int(round(self.line_length * scale)))
+        self._rows, self._cols = np.nonzero(mask)
+
+    def __call__(self, image, scale=1.0):
+        key = (image.shape[0], image.shape[1], scale)
+        if key != self._key:
+            self._render(image.shape[0], image.shape[1], scale)
+            self._key = key
+        image[self._rows, self._cols] = self.color
+
+
+# === Preview Renderer ===
+class PreviewRenderer:
+    """
+    Turns camera frames into mirrored, label-sized RGB images and shows them in a Tk label.
+
+    render(frame, display_size) may run on any thread (e.g. the capture thread): it crops the frame to
+    the label's aspect ratio, resizes it with a cheap OpenCV interpolation straight into preallocated
+    buffers, mirrors it, lets decorate(image, scale) draw on it (scale = display pixels per camera pixel)
+    and converts it to RGB. Crop geometry and buffers are only recomputed when the frame or label size
+    changes. The returned array is one of a small ring of output buffers, so a frame being shown is not
+    overwritten by the next render.
+
+    show(label, image) runs on the Tk thread and pastes the image into one PhotoImage that is reused
+    for as long as the display size stays the same, instead of creating a new PhotoImage per frame.
+
+    render_time and show_time hold the smoothed per-frame cost in seconds; summary() formats them.
+    """
+
+    def __init__(self, decorate=None, interpolation=cv2.INTER_LINEAR, buffer_count=3):
+        self.decorate = decorate
+        self.interpolation = interpolation
+        self.buffer_count = buffer_count
+        self.render_time = None
+        self.show_time = None
+        self.frames_rendered = 0
+        self.frames_shown = 0
+        self._geometry_key = None
+        self._crop = None
+        self._scale = 1.0
+        self._resized = None
+        self._mirrored = None
+        self._outputs = []
+        self._next_output = 0
+        self._photo = None
+        self._photo_size = None
+
+    def _update_geometry(self, frame, display_size):
+        frame_h, frame_w = frame.shape[:2]
+        label_width, label_height = display_size
+        key = (frame_w, frame_h, label_width, label_height, frame.dtype)
+        if key == self._geometry_key:
+            return
+        self._geometry_key = key
+        self._crop = compute_display_crop(frame_w, frame_h, label_width, label_height)
+        self._scale = label_width / self._crop[2]
+        shape = (label_height, label_width, 3)
+        self._resized = np.empty(shape, dtype=frame.dtype)
+        self._mirrored = np.empty(shape, dtype=frame.dtype)
+        self._outputs = [np.empty(shape, dtype=frame.dtype) for _ in range(self.buffer_count)]
+        self._next_output = 0
+
+    def render(self, frame, display_size):
+        start_time = time.perf_counter()
+        display_size = tuple(display_size) # The Tk thread may resize it while this frame renders
+        self._update_geometry(frame, display_size)
+        crop_x, crop_y, crop_w, crop_h = self._crop
+        label_width, label_height = display_size
+
+        # The crop is centered, so mirroring after the resize shows the same region as mirroring first
+        cropped_frame = frame[crop_y : crop_y + crop_h, crop_x : crop_x + crop_w]
+        cv2.resize(cropped_frame, (label_width, label_height), dst=self._resized, interpolation=self.interpolation)
+        cv2.flip(self._resized, 1, dst=self._mirrored)
+        if self.decorate is not None:
+            self.decorate(self._mirrored, self._scale)
+
+        output = self._outputs[self._next_output]
+        self._next_output = (self._next_output + 1) % len(self._outputs)
+        cv2.cvtColor(self._mirrored, cv2.COLOR_BGR2RGB, dst=output)
+
+        self.render_time = _smooth(self.render_time, time.perf_counter() - start_time)
+        self.frames_rendered += 1
+        return output
+
+    def show(self, label, image):
+        start_time = time.perf_counter()
+        pil_image = Image.fromarray(image)
+        if self._photo is None or self._photo_size != pil_image.size:
+            self._photo = ImageTk.PhotoImage(image=pil_image)
+            self._photo_size = pil_image.size
+            label.imgtk = self._photo # Keep a reference so Tk does not drop the image
+            label.config(image=self._photo)
+        else:
+            self._photo.paste(pil_image)
+
+        self.show_time = _smooth(self.show_time, time.perf_counter() - start_time)
+        self.frames_shown += 1
+
+    def summary(self):
+        if self.render_time is None:
+            return "no frames rendered"
+        show_ms = f"{self.show_time * 1000:.1f} ms" if self.show_time is not None else "n/a"
+        return (f"{self.frames_rendered} frames rendered, {self.frames_shown} shown, "
+                f"render {self.render_time * 1000:.1f} ms/frame, show {show_ms}/frame")
+
+
+def _smooth(average, sample):
+    return sample if average is None else 0.9 * average + 0.1 * sample
@@ -1,55 +1,234 @@
 import os
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import cv2
 import numpy as np
-import pickle
-from mtcnn import MTCNN
-from keras_facenet import FaceNet
+from face_detection import select_best_face, crop_face, detect_faces_downscaled, create_stage_detectors
+from face_embedding import create_configured_embedder
+from onnx_sessions import limit_onnx_threads
+from pipeline_config import load_pipeline_config
+from embedding_store import save_face_data, merge_locker_embeddings, remove_locker_embeddings, STORE_DTYPES, DEFAULT_STORE_DTYPE
 
-embedder = FaceNet()
-detector = MTCNN()
+# Models are loaded on first use, so removing a locker does not pay for TensorFlow start-up
+embedder = None
+detector = None
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 dataset_path = os.path.join(BASE_DIR, "dataset")
+embedding_dir = os.path.join(BASE_DIR, "Code", "embeddings")
+embeddings_file = os.path.join(embedding_dir, "face_embeddings.json")
+
+# Number of face crops per FaceNet call. Larger batches amortize the per-call overhead but raise
+# peak memory; lower it if a Pi with little RAM starts swapping, raise it on boards with more RAM.
+EMBEDDING_BATCH_SIZE = 16
+
+# Number of processes running face detection in parallel for a full rebuild (one detector per process).
+# Every process pays for importing TensorFlow and building its own detector, so a pool is only used
+# with at least IMAGES_PER_DETECTION_WORKER images per process, up to one process per CPU core.
+# Single-locker enrollment (8-15 images) always detects in this process.
+MAX_DETECTION_WORKERS = os.cpu_count() or 1
+IMAGES_PER_DETECTION_WORKER = 50
+
+def detection_workers_for(image_count, max_workers=MAX_DETECTION_WORKERS):
+    """Number of detection processes worth starting for image_count images (1 = no pool)."""
+    return max(1, min(max_workers, image_count // IMAGES_PER_DETECTION_WORKER))
+
+# Detection runs on a copy downscaled to this longest side; faces are still cropped from the full image.
+# Keep it equal to DETECTION_MAX_SIDE in the UIs so training and recognition crops match.
+DETECTION_MAX_SIDE = 640
+
+# Face detector for the training crop unless pipeline_config.json sets "detectors": {"training": ...}.
+# Use the same backend as the UIs' recognition stage so enrolled and live crops are framed alike.
+TRAINING_DETECTOR = "mtcnn"
+
+def create_training_detector():
+    return create_stage_detectors(load_pipeline_config(), {"training": TRAINING_DETECTOR})["training"]
+
+def load_models(load_detector=True):
+    global embedder, detector
+    if embedder is None:
+        # The packaged FaceNet (package_models.py) unless pipeline_config.json sets "embedder"
+        embedder = create_configured_embedder(load_pipeline_config())
+        if embedder is None:
+            raise RuntimeError("No face embedder could be loaded for training.")
+    if load_detector and detector is None:
+        detector = create_training_detector()
+        if detector is None:
+            raise RuntimeError("No face detector could be loaded for training.")
+
+def use_models(loaded_embedder, loaded_detector):
+    """Reuses models the caller already holds in memory (e.g. the UI process) instead of loading new ones."""
+    global embedder, detector
+    embedder = loaded_embedder
+    detector = loaded_detector
+
+def _init_detection_worker():
+    """Gives each pool process its own single-threaded detector, so workers do not oversubscribe the cores."""
+    global detector
+    try:
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(1)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except Exception as e:
+        print(f"Warning: Could not limit TensorFlow threads in detection worker: {e}")
+    cv2.setNumThreads(1) # Same for the OpenCV backends (Haar, YuNet, SSD)
+    limit_onnx_threads(1) # And for ONNX Runtime sessions (UltraFace)
+    detector = create_training_detector()
 
 def extract_face(img_path, required_size=(160, 160)):
     img = cv2.imread(img_path)
     if img is None:
         return None
-    results = detector.detect_faces(img)
-    if len(results) == 0:
+    results = detect_faces_downscaled(detector, img, DETECTION_MAX_SIDE)
+    best_face_info = select_best_face(results, detector.min_confidence)
+    if best_face_info is None:
         return None
-    x, y, w, h = results[0]['box']
-    x, y = max(x, 0), max(y, 0)
-    face = img[y:y + h, x:x + w]
-    face = cv2.resize(face, required_size)
-    return face
+    return crop_face(img, best_face_info, required_size)
 
-face_data = {} 
+def _report(progress, stage, done, total):
+    if progress is not None:
+        progress(stage, done, total)
 
-for person_name in os.listdir(dataset_path):
+def extract_faces(img_paths, workers=1, progress=None):
+    """
+    Runs extract_face over img_paths and returns the crops (or None) in the same order.
+    With more than one worker, detection is spread over a pool of processes.
+    progress(stage, done, total), if given, is called after every image.
+    """
+    faces = []
+    if workers <= 1 or len(img_paths) <= 1:
+        load_models()
+        for img_path in img_paths:
+            faces.append(extract_face(img_path))
+            _report(progress, "detecting", len(faces), len(img_paths))
+        return faces
+
+    # 'spawn' keeps the workers from inheriting this process's TensorFlow state
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, len(img_paths)), mp_context=context,
+                             initializer=_init_detection_worker) as executor:
+        for face in executor.map(extract_face, img_paths):
+            faces.append(face)
+            _report(progress, "detecting", len(faces), len(img_paths))
+    return faces
+
+def list_locker_images(person_name):
+    """Returns the image paths of dataset/<person_name> in a stable order."""
     person_path = os.path.join(dataset_path, person_name)
-    if not os.path.isdir(person_path):
-        continue
-    face_data[person_name] = []
-    for img_name in os.listdir(person_path):
-        img_path = os.path.join(person_path, img_name)
-        face = extract_face(img_path)
+    return [os.path.join(person_path, img_name) for img_name in sorted(os.listdir(person_path))]
+
+def collect_locker_faces(person_name, workers=1, progress=None):
+    """Detects and crops the face in every usable image of dataset/<person_name>."""
+    img_paths = list_locker_images(person_name)
+    faces = []
+    for img_path, face in zip(img_paths, extract_faces(img_paths, workers, progress)):
         if face is not None:
-            # Note: The original code used embedder.embeddings([face])[0]
-            # If face_pixels normalization is intended (as discussed previously), it should be applied here.
-            # Example for pixel normalization:
-            # face_pixels = face.astype('float32')
-            # mean, std = face_pixels.mean(), face_pixels.std()
-            # face_pixels = (face_pixels - mean) / std
-            # emb = embedder.embeddings(np.expand_dims(face_pixels, axis=0))[0]
-            
-            emb = embedder.embeddings([face])[0] # Original line from your provided snippet
-            face_data[person_name].append(emb)
-            print(f"Extracted embedding: {person_name} / {img_name}") 
+            faces.append(face)
+            print(f"Extracted face: {person_name} / {os.path.basename(img_path)}")
+    return faces
 
-embedding_dir = os.path.join(BASE_DIR, "Code", "embeddings")
-os.makedirs(embedding_dir, exist_ok=True)
-with open(os.path.join(embedding_dir, "face_cosine_data.pkl"), "wb") as f:
-    pickle.dump(face_data, f)
+def embed_faces(faces, batch_size=EMBEDDING_BATCH_SIZE, progress=None):
+    """Runs FaceNet over the face crops in batches of batch_size and returns one embedding per face."""
+    embeddings = []
+    for start in range(0, len(faces), batch_size):
+        batch = np.stack(faces[start:start + batch_size])
+        # Note: The original code used embedder.embeddings([face])[0]
+        # If face_pixels normalization is intended (as discussed previously), it should be applied here.
+        # Example for pixel normalization:
+        # face_pixels = batch.astype('float32')
+        # mean = face_pixels.mean(axis=(1, 2, 3), keepdims=True)
+        # std = face_pixels.std(axis=(1, 2, 3), keepdims=True)
+        # batch = (face_pixels - mean) / std
+        embeddings.extend(embedder.embeddings(batch))
+        print(f"Embedded faces {start + 1}-{start + len(batch)} of {len(faces)}")
+        _report(progress, "embedding", start + len(batch), len(faces))
+    return embeddings
+
+def train_all(batch_size=EMBEDDING_BATCH_SIZE, workers=None, dtype=DEFAULT_STORE_DTYPE, progress=None):
+    """Rebuilds the whole store from every locker folder in dataset/. workers=None sizes the pool from the image count."""
+    locker_images = {}
+    for person_name in sorted(os.listdir(dataset_path)):
+        person_path = os.path.join(dataset_path, person_name)
+        if not os.path.isdir(person_path):
+            continue
+        locker_images[person_name] = list_locker_images(person_name)
+
+    # Detect faces for all lockers in one parallel pass, then group the crops back per locker
+    all_img_paths = [img_path for img_paths in locker_images.values() for img_path in img_paths]
+    if workers is None:
+        workers = detection_workers_for(len(all_img_paths))
+    all_faces = extract_faces(all_img_paths, workers, progress)
+    locker_faces = {}
+    start = 0
+    for person_name, img_paths in locker_images.items():
+        locker_faces[person_name] = []
+        for img_path, face in zip(img_paths, all_faces[start:start + len(img_paths)]):
+            if face is not None:
+                locker_faces[person_name].append(face)
+                print(f"Extracted face: {person_name} / {os.path.basename(img_path)}")
+        start += len(img_paths)
+
+    load_models(load_detector=workers <= 1)
+
+    # Embed the faces of all lockers together so batches stay full, then split them back per locker
+    all_faces = [face for faces in locker_faces.values() for face in faces]
+    all_embeddings = embed_faces(all_faces, batch_size, progress)
+    face_data = {}
+    start = 0
+    for person_name, faces in locker_faces.items():
+        face_data[person_name] = all_embeddings[start:start + len(faces)]
+        start += len(faces)
+
+    save_face_data(embeddings_file, face_data, dtype)
+    print("Training successful! Embeddings saved to the embeddings store") 
+
+def enroll_locker(person_name, batch_size=EMBEDDING_BATCH_SIZE, workers=1, progress=None):
+    """Embeds only dataset/<person_name> and merges it into the existing store."""
+    person_path = os.path.join(dataset_path, person_name)
+    if not os.path.isdir(person_path):
+        print(f"Error: Locker folder not found: {person_path}")
+        return False
+    faces = collect_locker_faces(person_name, workers, progress)
+    if not faces:
+        # Merging an empty list would drop the locker's existing embeddings
+        print(f"Error: No face found for locker {person_name}, its embeddings were left unchanged")
+        return False
+    load_models(load_detector=workers <= 1)
+    embeddings = embed_faces(faces, batch_size, progress)
+    merge_locker_embeddings(embeddings_file, person_name, embeddings)
+    print(f"Enrollment successful! {len(embeddings)} embeddings for locker {person_name} merged into the embeddings store")
+    return True
+
+def remove_locker(person_name):
+    """Drops dataset/<person_name>'s embeddings from the store without touching other lockers."""
+    if remove_locker_embeddings(embeddings_file, person_name):
+        print(f"Removed locker {person_name} from the embeddings store")
+    else:
+        print(f"Locker {person_name} not found in the embeddings store")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build face embeddings for the smart lockers.")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--locker", help="Only (re-)embed dataset/<LOCKER> and merge it into the existing store.")
+    group.add_argument("--remove", help="Only remove LOCKER's embeddings from the existing store.")
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE,
+                        help=f"Number of faces per FaceNet call (default: {EMBEDDING_BATCH_SIZE}).")
+    parser.add_argument("--workers", type=int, default=None,
+                        help=f"Number of face detection processes (default: 1 for --locker; for a full rebuild one per "
+                             f"{IMAGES_PER_DETECTION_WORKER} images, up to {MAX_DETECTION_WORKERS}).")
+    parser.add_argument("--dtype", choices=sorted(STORE_DTYPES), default=DEFAULT_STORE_DTYPE,
+                        help="Storage precision of the embeddings matrix for a full rebuild (default: float32).")
+    args = parser.parse_args()
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
 
-print("Training successful! Embeddings saved to face_cosine_data.pkl") 
\ No newline at end of file
+    if args.locker is not None:
+        if not enroll_locker(args.locker, args.batch_size, args.workers or 1):
+            raise SystemExit(1)
+    elif args.remove is not None:
+        remove_locker(args.remove)
+    else:
+        train_all(args.batch_size, args.workers, args.dtype)
\ No newline at end of file
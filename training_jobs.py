@@ -0,0 +1,114 @@
+import queue
+import threading
+from collections import OrderedDict
+
+# === Job Kinds ===
+JOB_ENROLL = "enroll"   # (Re-)embed one locker folder and merge it into the store
+JOB_REMOVE = "remove"   # Drop one locker from the store
+
+# === Event Types (pushed to TrainingJobQueue.events) ===
+EVENT_STARTED = "started"
+EVENT_PROGRESS = "progress"
+EVENT_FINISHED = "finished"
+EVENT_FAILED = "failed"
+
+
+class TrainingJobQueue:
+    """
+    Runs enrollment and index-maintenance jobs one at a time on a background thread.
+
+    run_job(kind, locker_name, report_progress) does the actual work; report_progress(stage, done, total)
+    may be called from it to publish progress. Every state change is pushed to the `events` queue as
+    (event_type, kind, locker_name, detail) for the UI to poll with window.after.
+
+    Jobs that have not started yet are coalesced: a newer job for the same locker replaces the pending one.
+    The exception is an enrollment arriving while a removal of the same locker is pending: the removal
+    still runs first, so the previous occupant's embeddings never outlive the new enrollment.
+    Recognition is never blocked, it keeps using the last committed store while a job runs.
+    """
+
+    def __init__(self, run_job):
+        self.run_job = run_job
+        self.events = queue.Queue()
+        self._pending = OrderedDict() # locker_name -> [kind, ...] run in order
+        self._condition = threading.Condition()
+        self._running = False
+        self._busy = False
+        self._current = None # locker_name of the running job
+        self._thread = None
+
+    def start(self):
+        with self._condition:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._worker, daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        """Stops the worker after the current job. Pending jobs are dropped."""
+        with self._condition:
+            self._running = False
+            self._pending.clear()
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            if self._thread.is_alive():
+                print("Warning: Training job thread did not terminate gracefully.")
+
+    def submit(self, kind, locker_name):
+        """Queues a job for one locker."""
+        locker_name = str(locker_name)
+        with self._condition:
+            if locker_name in self._pending:
+                queued = self._pending[locker_name]
+                if kind == JOB_ENROLL and queued[0] == JOB_REMOVE:
+                    print(f"Training jobs: '{kind}' for locker {locker_name} queued after its pending '{JOB_REMOVE}'.")
+                    queued[1:] = [kind]
+                    self._condition.notify()
+                    return
+                print(f"Training jobs: Pending '{queued[-1]}' for locker {locker_name} replaced by '{kind}'.")
+                del self._pending[locker_name]
+            self._pending[locker_name] = [kind]
+            self._condition.notify()
+
+    def is_busy(self):
+        """True while a job is running or waiting to run."""
+        with self._condition:
+            return self._busy or bool(self._pending)
+
+    def has_job(self, locker_name):
+        """True while a job for this locker is running or waiting to run."""
+        locker_name = str(locker_name)
+        with self._condition:
+            return locker_name in self._pending or (self._busy and self._current == locker_name)
+
+    def _worker(self):
+        print("Training job thread started.")
+        while True:
+            with self._condition:
+                while self._running and not self._pending:
+                    self._condition.wait()
+                if not self._running:
+                    break
+                locker_name, kinds = next(iter(self._pending.items()))
+                kind = kinds.pop(0)
+                if not kinds:
+                    del self._pending[locker_name]
+                self._busy = True
+                self._current = locker_name
+
+            def report_progress(stage, done, total):
+                self.events.put((EVENT_PROGRESS, kind, locker_name, (stage, done, total)))
+
+            self.events.put((EVENT_STARTED, kind, locker_name, None))
+            try:
+                result = self.run_job(kind, locker_name, report_progress)
+                self.events.put((EVENT_FINISHED, kind, locker_name, result))
+            except Exception as e:
+                print(f"Training jobs: '{kind}' for locker {locker_name} failed: {e}")
+                self.events.put((EVENT_FAILED, kind, locker_name, e))
+            finally:
+                with self._condition:
+                    self._busy = False
+        print("Training job thread stopped.")
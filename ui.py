@@ -11,19 +11,23 @@ import queue
 
 # Imports for Face Recognition (from train.py)
 import numpy as np
-import pickle
-# Try importing MTCNN and FaceNet. If not found, show a warning and disable recognition.
+from embedding_store import EmbeddingCache, remove_locker_embeddings
+from face_embedding import create_configured_embedder
+from face_detection import select_best_face, offset_face, crop_face, detect_faces_downscaled, detect_faces_in_region, map_face_to_frame, FaceTracker, opencv_tracker_available, create_stage_detectors, same_detector_model
+from pipeline_config import load_pipeline_config
+from preview_renderer import PreviewRenderer, GuideOverlay
+from camera_pipeline import CameraService, load_camera_profile, apply_camera_profile, DetectionThread, DetectionScheduler, compute_display_crop
+from training_jobs import TrainingJobQueue, JOB_ENROLL, JOB_REMOVE, EVENT_STARTED, EVENT_PROGRESS, EVENT_FINISHED, EVENT_FAILED
+from model_engine import ModelEngine
+
+# Training API (from train.py) so retraining can run in this process on the already-loaded models.
+# If it cannot be imported, retraining falls back to running 'train.py' as a subprocess.
 try:
-    from mtcnn import MTCNN
-    from keras_facenet import FaceNet
-    FACENET_AVAILABLE = True
-except ImportError:
-    # Use a placeholder message, as show_temp_toplevel_message might not be defined yet
-    print("Warning: 'mtcnn' or 'keras_facenet' library not found. Face recognition functions will be disabled.")
-    FACENET_AVAILABLE = False
+    import train as trainer
+    TRAINER_AVAILABLE = True
 except Exception as e:
-    print(f"Warning: Error loading FaceNet libraries: {e}. Face recognition functions will be disabled.")
-    FACENET_AVAILABLE = False
+    print(f"Warning: Could not import the training API from 'train.py': {e}. Retraining will run as a subprocess.")
+    TRAINER_AVAILABLE = False
 
 # === Function to display temporary Toplevel messages ===
 def show_temp_toplevel_message(title, message, delay=2000):
@@ -68,14 +72,31 @@ LOCKER_COUNT = 4
 AVAILABLE_FILE = "available.txt"
 DATASET_DIR = "dataset" # For SEND (adding new users/items to lockers)
 CAPTURED_DIR = "captured" # For GET/ADD (recognition images, temporary)
-# Path to the embeddings file generated by train.py
-EMBEDDINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Code", "embeddings", "face_cosine_data.pkl")
+# Path to the embeddings store header generated by train.py (the matrix file sits next to it)
+EMBEDDINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Code", "embeddings", "face_embeddings.json")
 RECOGNITION_THRESHOLD = 0.75 # Cosine similarity threshold for face recognition (can be adjusted)
+DETECTION_MAX_SIDE = 640 # MTCNN runs on a copy downscaled to this longest side; faces are cropped from the full frame
 
 # Camera Configuration from cam.py
 CAMERA_WIDTH = 1200
 CAMERA_HEIGHT = 2048
 CAMERA_INDEX = 0
+# Dual-stream capture: preview and detection run on a low-resolution stream and the camera switches to
+# CAMERA_WIDTH x CAMERA_HEIGHT only for the frames recognition and enrollment crop from.
+# Set both to None to stream at full resolution all the time (e.g. if mode switches are slow on a camera).
+PREVIEW_CAMERA_WIDTH = 600
+PREVIEW_CAMERA_HEIGHT = 1024
+# Fraction of the preview box added on each side when re-locating the face in a full-resolution snapshot
+SNAPSHOT_SEARCH_MARGIN = 0.5
+
+# A measured camera profile ('python camera_measure.py --benchmark') overrides the resolutions above
+# and sets the camera's pixel format (FOURCC) and buffer size
+camera_profile = load_camera_profile()
+if camera_profile:
+    CAMERA_WIDTH, CAMERA_HEIGHT = camera_profile["snapshot_width"], camera_profile["snapshot_height"]
+    PREVIEW_CAMERA_WIDTH, PREVIEW_CAMERA_HEIGHT = camera_profile["preview_width"], camera_profile["preview_height"]
+    print(f"Using camera profile: {camera_profile['fourcc']}, buffer size {camera_profile['buffer_size']}, "
+          f"preview {PREVIEW_CAMERA_WIDTH}x{PREVIEW_CAMERA_HEIGHT}, snapshot {CAMERA_WIDTH}x{CAMERA_HEIGHT}")
 # FULLSCREEN_MODE is handled dynamically for the Toplevel camera window
 WINDOW_TITLE_CAMERA = "Smart Locker Camera Interface"
 
@@ -85,6 +106,35 @@ BORDER_WIDTH_RATIO = 0.7
 BORDER_HEIGHT_RATIO = 0.6
 BORDER_RADIUS = 30
 SHORT_LINE_LENGTH = 50
+# One guide for every camera window: it is drawn once per display size and composited onto every frame,
+# so later transactions at the same screen size reuse the mask
+preview_guide = GuideOverlay(BORDER_COLOR, BORDER_THICKNESS, BORDER_RADIUS, SHORT_LINE_LENGTH, BORDER_WIDTH_RATIO, BORDER_HEIGHT_RATIO)
+
+# Live preview detection cadence: full detection runs at most PREVIEW_DETECTION_RATE_HZ times per second,
+# at most once every PREVIEW_DETECTION_EVERY_K_FRAMES camera frames (None = no limit), and never more often
+# than keeps the detector below PREVIEW_DETECTION_MAX_DUTY_CYCLE of the time. In between, the last result is reused.
+PREVIEW_DETECTION_RATE_HZ = 10
+PREVIEW_DETECTION_EVERY_K_FRAMES = None
+PREVIEW_DETECTION_MAX_DUTY_CYCLE = 0.5
+# Between full detections, follow the last detected face with a cheap OpenCV tracker (KCF/MOSSE, needs
+# opencv-contrib-python), updated at most PREVIEW_TRACKING_RATE_HZ times per second. While the track holds,
+# full detection only runs PREVIEW_VERIFY_RATE_HZ times per second to confirm the face is still there; a lost
+# or drifting track, or a verification without a face, returns to the cadence above. Without such a tracker,
+# or with PREVIEW_TRACKING_ENABLED = False, the last detection result is reused instead.
+PREVIEW_TRACKING_ENABLED = True
+PREVIEW_TRACKING_RATE_HZ = 15
+PREVIEW_VERIFY_RATE_HZ = 2
+PREVIEW_TRACKING = PREVIEW_TRACKING_ENABLED and opencv_tracker_available()
+if PREVIEW_TRACKING_ENABLED and not PREVIEW_TRACKING:
+    print("Preview tracking: No KCF/MOSSE tracker in this OpenCV build, reusing the last detection between detections.")
+
+# Face detector for each pipeline stage: live preview gating, the recognition crop and the training crop.
+# Backends: "haar", "mtcnn", "yunet", "ssd", "ultraface" (see face_detection.py). Override per stage in pipeline_config.json.
+DEFAULT_DETECTORS = {
+    "preview": "haar",
+    "recognition": "mtcnn",
+    "training": "mtcnn",
+}
 
 # New constant for camera display duration after recognition (for ADD/GET)
 POST_RECOGNITION_CAMERA_DURATION_MS = 500 # Keep camera open for 5 seconds after recognition
@@ -130,12 +180,6 @@ if GPIO_AVAILABLE:
 # Pick_ID[1] through Pick_ID[4] will be the status read from GPIO.
 Pick_ID = [0, 0, 0, 0, 0]
 
-# Load the pre-trained face cascade classifier
-# Make sure 'haarcascade_frontalface_default.xml' is available in your OpenCV data path
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-if face_cascade.empty():
-    show_temp_toplevel_message("Face Detection Error", "Could not load face cascade classifier. Make sure 'haarcascade_frontalface_default.xml' is in your OpenCV data path.")
-
 # Load the pre-trained eye cascade classifier
 eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
 if eye_cascade.empty():
@@ -147,52 +191,119 @@ if smile_cascade.empty():
     show_temp_toplevel_message("Smile Detection Error", "Could not load smile cascade classifier. Make sure 'haarcascade_smile.xml' is in your OpenCV data path.")
 
 
-# Initialize FaceNet and MTCNN globally if available
-if FACENET_AVAILABLE:
-    embedder = FaceNet()
-    detector = MTCNN()
-else:
-    embedder = None
-    detector = None
+# Keep the embeddings store resident in memory for the lifetime of the UI
+embedding_cache = EmbeddingCache(EMBEDDINGS_FILE)
+
+# === Face Models (loaded in the background by model_engine) ===
+# TensorFlow, FaceNet and the detectors take long to load, so the window comes up first and these
+# globals are filled in by load_face_models(). Anything that needs them waits on model_engine.
+FACENET_AVAILABLE = False
+embedder = None
+preview_detector = None
+recognition_detector = None
+training_detector = None
+REUSE_PREVIEW_DETECTION = False
+
+def load_face_models():
+    """Runs on the model engine's thread. If FaceNet cannot be loaded, recognition functions are disabled."""
+    global FACENET_AVAILABLE, embedder, preview_detector, recognition_detector, training_detector, REUSE_PREVIEW_DETECTION
+    model_engine.set_stage("Loading embeddings")
+    embedding_cache.preload()
+    config = load_pipeline_config()
+
+    # The packaged FaceNet (package_models.py) if present, else keras_facenet; "embedder" in pipeline_config.json overrides it
+    model_engine.set_stage("Loading FaceNet")
+    embedder = create_configured_embedder(config)
+    FACENET_AVAILABLE = embedder is not None
+    if not FACENET_AVAILABLE:
+        print("Warning: No FaceNet embedder could be loaded. Face recognition functions will be disabled.")
+
+    # One face detector per pipeline stage (see DEFAULT_DETECTORS); stages using the same model share it
+    model_engine.set_stage("Loading face detectors")
+    detectors = create_stage_detectors(config, DEFAULT_DETECTORS)
+    # Recognition crops straight from the preview's (tracked) box only if both stages run the same model
+    REUSE_PREVIEW_DETECTION = same_detector_model(detectors["preview"], detectors["recognition"])
+    recognition_detector = detectors["recognition"]
+    training_detector = detectors["training"]
+    preview_detector = detectors["preview"]
+
+# Image with a face used to warm up the models; the first image in dataset/ is used if this file is missing
+WARM_UP_IMAGE = os.path.join("picture", "warmup_face.jpg")
+
+def load_warm_up_image():
+    """
+    Returns an image with a real face in it, or None. MTCNN only runs its later stages (RNet, ONet) on
+    face candidates, so a blank or noise image would leave their set-up cost to the first real GET.
+    """
+    candidates = [WARM_UP_IMAGE]
+    if os.path.isdir(DATASET_DIR):
+        for person_name in sorted(os.listdir(DATASET_DIR)):
+            person_path = os.path.join(DATASET_DIR, person_name)
+            if os.path.isdir(person_path):
+                candidates += [os.path.join(person_path, img_name) for img_name in sorted(os.listdir(person_path))]
+    for path in candidates:
+        img = cv2.imread(path) if os.path.exists(path) else None
+        if img is not None:
+            return img
+    return None
+
+def warm_up_face_models():
+    """
+    Runs the loaded models once on inputs of the production shapes, so the first real GET does not pay
+    graph tracing and allocation costs: a preview frame through the preview detector, a snapshot frame
+    through the recognition and training detectors and a 160x160 face batch through FaceNet.
+    """
+    face_image = load_warm_up_image()
+    if face_image is None:
+        print("Warning: No face image to warm up with (see WARM_UP_IMAGE); using noise, MTCNN may not be fully warmed up.")
+        face_image = np.random.default_rng(0).integers(0, 256, (480, 640, 3), dtype=np.uint8)
+    snapshot_shape = (CAMERA_HEIGHT, CAMERA_WIDTH, 3)
+    preview_shape = (PREVIEW_CAMERA_HEIGHT, PREVIEW_CAMERA_WIDTH, 3) if PREVIEW_CAMERA_WIDTH and PREVIEW_CAMERA_HEIGHT else snapshot_shape
+    warmed = set()
+    for detector, shape in ((preview_detector, preview_shape), (recognition_detector, snapshot_shape), (training_detector, snapshot_shape)):
+        if detector is None or (id(detector.model), shape) in warmed:
+            continue
+        warmed.add((id(detector.model), shape))
+        detect_faces_downscaled(detector, cv2.resize(face_image, (shape[1], shape[0])), DETECTION_MAX_SIDE)
+    if FACENET_AVAILABLE:
+        face_batch = cv2.resize(face_image, (160, 160))[np.newaxis].astype(np.uint8)
+        embedder.embeddings(face_batch) # Same dtype as the uint8 crops recognition embeds
+
+model_engine = ModelEngine(load_face_models, warm_up=warm_up_face_models)
+# Start right away so the models load while the window is being built
+model_engine.start()
 
 # === Helper: Face Extraction for Recognition ===
-def extract_face_from_img_array(img_array, required_size=(160, 160)):
-    """Extracts a face from an image (numpy array) using MTCNN."""
+def extract_face_from_img_array(img_array, required_size=(160, 160), region=None):
+    """
+    Extracts the largest confident face from an image (numpy array) using the recognition detector.
+    If region (an approximate box) is given, the detector looks around it before scanning the whole image.
+    """
     if img_array is None:
         return None
     
-    if detector is None: # Fallback if MTCNN is not initialized
-        print("MTCNN detector not available for face extraction.")
+    if recognition_detector is None: # Fallback if no recognition detector could be loaded
+        print("Recognition face detector not available for face extraction.")
         return None
 
-    results = detector.detect_faces(img_array)
-    if len(results) == 0:
-        return None
-    
-    # Get the first detected face
-    x, y, w, h = results[0]['box']
-    
-    # Ensure coordinates are within image bounds
-    h_img, w_img, _ = img_array.shape
-    x1, y1 = max(0, x), max(0, y)
-    x2, y2 = min(w_img, x + w), min(h_img, y + h)
-
-    face = img_array[y1:y2, x1:x2]
-    
-    if face.shape[0] == 0 or face.shape[1] == 0: # Handle cases where crop results in empty image
+    best_face_info = None
+    if region is not None:
+        results = detect_faces_in_region(recognition_detector, img_array, region, SNAPSHOT_SEARCH_MARGIN, DETECTION_MAX_SIDE)
+        best_face_info = select_best_face(results, recognition_detector.min_confidence)
+    if best_face_info is None:
+        results = detect_faces_downscaled(recognition_detector, img_array, DETECTION_MAX_SIDE)
+        best_face_info = select_best_face(results, recognition_detector.min_confidence)
+    if best_face_info is None:
         return None
-
-    try:
-        face = cv2.resize(face, required_size)
-    except cv2.error as e:
-        print(f"Error resizing face: {e}")
-        return None
-    return face
+    return crop_face(img_array, best_face_info, required_size)
 
 # === Helper: Perform Face Recognition ===
-def perform_face_recognition(captured_image_array):
+def perform_face_recognition(captured_image_array, face_info=None, region=None):
     """
     Performs face recognition on a captured image array using pre-trained embeddings.
+    If face_info (a detection in the image's coordinates) is given, the face is cropped
+    from it directly instead of running the recognition detector on the image again.
+    If region (an approximate box) is given, the detector searches around it first.
     Returns the matched locker ID (integer) or 0 if no match.
     """
     if not FACENET_AVAILABLE:
@@ -204,13 +315,17 @@ def perform_face_recognition(captured_image_array):
         return 0
 
     try:
-        with open(EMBEDDINGS_FILE, "rb") as f:
-            face_data = pickle.load(f)
+        # Served from memory; only reloaded from disk when train.py has rewritten the file
+        embedding_index = embedding_cache.get()
     except Exception as e:
         show_temp_toplevel_message("Recognition Error", f"Error loading embeddings: {e}")
         return 0
 
-    extracted_face = extract_face_from_img_array(captured_image_array)
+    if face_info is not None:
+        # Reuse the detection the preview already made on this exact frame
+        extracted_face = crop_face(captured_image_array, face_info)
+    else:
+        extracted_face = extract_face_from_img_array(captured_image_array, region=region)
     if extracted_face is None:
         print("No face detected in the captured image for recognition.")
         return 0
@@ -221,25 +336,11 @@ def perform_face_recognition(captured_image_array):
         show_temp_toplevel_message("Recognition Error", f"Error generating embedding: {e}")
         return 0
 
-    best_match_id = 0
-    highest_similarity = -1.0
+    # Match against all stored embeddings with a single matrix-vector product
+    best_match_id, highest_similarity = embedding_index.match(candidate_embedding)
+    if highest_similarity < RECOGNITION_THRESHOLD:
+        best_match_id = 0
 
-    for person_name_str, embeddings_list in face_data.items():
-        try:
-            person_id = int(person_name_str) # Assume person_name is the locker ID
-        except ValueError:
-            print(f"Warning: Non-integer person name '{person_name_str}' in embeddings. Skipping.")
-            continue
-
-        for stored_embedding in embeddings_list:
-            # Calculate cosine similarity
-            similarity = np.dot(candidate_embedding, stored_embedding) / \
-                         (np.linalg.norm(candidate_embedding) * np.linalg.norm(stored_embedding))
-            
-            if similarity > highest_similarity and similarity >= RECOGNITION_THRESHOLD:
-                highest_similarity = similarity
-                best_match_id = person_id
-    
     if best_match_id != 0:
         print(f"Recognized as Locker ID {best_match_id} with similarity {highest_similarity:.4f}")
     else:
@@ -253,15 +354,17 @@ def recognition_worker():
     print("Recognition worker thread started.")
     while thread_running:
         try:
-            # Wait for a frame from the queue, with a timeout to allow checking thread_running flag
-            frame_to_recognize = recognition_task_queue.get(timeout=1)
-            if frame_to_recognize is None: # This is the termination signal
+            # Wait for a (frame, face_info, region) task from the queue, with a timeout to allow checking thread_running flag
+            task = recognition_task_queue.get(timeout=1)
+            if task is None: # This is the termination signal
                 print("Recognition worker received termination signal.")
                 break
+            frame_to_recognize, face_info, region = task
 
+            model_engine.wait_ready()
             print("Worker: Performing face recognition...")
             # Call the computationally intensive recognition function
-            matched_id = perform_face_recognition(frame_to_recognize)
+            matched_id = perform_face_recognition(frame_to_recognize, face_info, region)
             print(f"Worker: Recognition finished, matched_id={matched_id}")
             recognition_result_queue.put(matched_id) # Put the result into the result queue
             recognition_task_queue.task_done() # Mark the task as done
@@ -277,6 +380,66 @@ def recognition_worker():
     print("Recognition worker thread stopped.")
 # -----------------------------------------------------------
 
+# === Background Training Jobs on the Already-Loaded Models ===
+def run_training_job(kind, locker_name, report_progress):
+    """
+    Executes one job on the training thread (see TrainingJobQueue).
+    Enrollment runs in-process on the UI's FaceNet and training detector so no model start-up is paid;
+    it falls back to running 'train.py' as a subprocess if the models are not available here.
+    """
+    if kind == JOB_REMOVE:
+        # Drop only this locker's embeddings from the store instead of retraining everything
+        return remove_locker_embeddings(EMBEDDINGS_FILE, locker_name)
+
+    model_engine.wait_ready()
+    if TRAINER_AVAILABLE and FACENET_AVAILABLE and training_detector is not None:
+        trainer.use_models(embedder, training_detector)
+        return trainer.enroll_locker(locker_name, workers=1, progress=report_progress)
+
+    print(f"Training worker: Enrolling locker {locker_name} with 'train.py' subprocess...")
+    # train.py --locker exits with 1 when no face was found, the store is left unchanged then
+    return subprocess.run(["python", "train.py", "--locker", locker_name]).returncode == 0
+
+training_jobs = TrainingJobQueue(run_training_job)
+
+def clear_training_status():
+    if not training_jobs.is_busy():
+        training_status_var.set("")
+
+def poll_training_events():
+    """Shows progress pushed by the training thread without ever blocking the main loop."""
+    try:
+        while True:
+            event_type, kind, locker_name, detail = training_jobs.events.get_nowait()
+            if event_type == EVENT_STARTED:
+                if kind == JOB_ENROLL:
+                    training_status_var.set(f"Training locker {locker_name} ...")
+                else:
+                    training_status_var.set(f"Removing locker {locker_name} ...")
+            elif event_type == EVENT_PROGRESS:
+                stage, done, total = detail
+                training_status_var.set(f"Training locker {locker_name}: {stage} {done}/{total}")
+            elif event_type == EVENT_FINISHED:
+                if kind == JOB_REMOVE:
+                    print(f"Removed embeddings for locker folder {locker_name}." if detail else f"No embeddings found for locker folder {locker_name}.")
+                    training_status_var.set("")
+                elif detail:
+                    training_status_var.set("Training completed.")
+                    window.after(3000, clear_training_status)
+                else:
+                    training_status_var.set(f"Training failed for locker {locker_name}.")
+                    window.after(3000, clear_training_status)
+            elif event_type == EVENT_FAILED:
+                training_status_var.set("")
+                if isinstance(detail, FileNotFoundError):
+                    show_temp_toplevel_message("Error", "Could not find 'train.py' file for retraining.")
+                else:
+                    show_temp_toplevel_message("Training Error", f"Error during retraining: {detail}")
+    except queue.Empty:
+        pass
+    window.after(200, poll_training_events)
+# -----------------------------------------------------------
+
 # === Helper: Available Lockers State ===
 def read_available_lockers():
     if os.path.exists(AVAILABLE_FILE):
@@ -291,29 +454,6 @@ def write_available_lockers(count):
     with open(AVAILABLE_FILE, "w") as f:
         f.write(str(count))
 
-# === Function to draw rounded corners and lines (UPDATED) ===
-def draw_rounded_corners_with_lines(image, p1, p2, color, thickness, r, line_length):
-    x1, y1 = p1
-    x2, y2 = p2
-
-    cv2.ellipse(image, (x1 + r, y1 + r), (r, r), 180, 0, 90, color, thickness)
-    cv2.ellipse(image, (x2 - r, y1 + r), (r, r), 270, 0, 90, color, thickness)
-    cv2.ellipse(image, (x1 + r, y2 - r), (r, r), 90, 0, 90, color, thickness)
-    cv2.ellipse(image, (x2 - r, y2 - r), (r, r), 0, 0, 90, color, thickness)
-
-    cv2.line(image, (x1 + r, y1), (x1 + r + line_length, y1), color, thickness)
-    cv2.line(image, (x2 - r, y1), (x2 - r - line_length, y1), color, thickness)
-
-    cv2.line(image, (x1 + r, y2), (x1 + r + line_length, y2), color, thickness)
-    cv2.line(image, (x2 - r, y2), (x2 - r - line_length, y2), color, thickness)
-
-    cv2.line(image, (x1, y1 + r), (x1, y1 + r + line_length), color, thickness)
-    cv2.line(image, (x1, y2 - r), (x1, y2 - r - line_length), color, thickness)
-
-    cv2.line(image, (x2, y1 + r), (x2, y1 + r + line_length), color, thickness)
-    cv2.line(image, (x2, y2 - r), (x2, y2 - r - line_length), color, thickness)
-
-
 # === Function to update Pick_ID status from GPIO (from PickID.py) ===
 def update_pick_id_status():
     global Pick_ID
@@ -408,6 +548,98 @@ tk.Label(frame, text="Available lockers:", font=normal_font_bold, fg="#B22222",
 tk.Entry(frame, textvariable=locker_var, font=normal_font_bold, width=3, justify="center", fg="#B22222", bg="#FFFFE0", state='readonly').pack(side="left", padx=5)
 
 
+# === Helper: Camera Preview Pipeline (capture and detection run off the Tk thread) ===
+def open_camera():
+    """Opens and configures the camera for the camera service. Returns None if it cannot be opened."""
+    cap = cv2.VideoCapture(CAMERA_INDEX)
+    if not cap.isOpened():
+        print(f"Error: Could not open camera with index {CAMERA_INDEX}.")
+        cap.release()
+        return None
+    apply_camera_profile(cap, camera_profile) # Pixel format and buffer size must be set before the resolution
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAMERA_WIDTH)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAMERA_HEIGHT)
+    print(f"Camera opened at {int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))}.")
+    return cap
+
+# The camera stays open (and warm) between transactions; camera windows subscribe to it
+preview_size = (PREVIEW_CAMERA_WIDTH, PREVIEW_CAMERA_HEIGHT) if PREVIEW_CAMERA_WIDTH and PREVIEW_CAMERA_HEIGHT else None
+camera_service = CameraService(open_camera, preview_size=preview_size, snapshot_size=(CAMERA_WIDTH, CAMERA_HEIGHT))
+
+def request_recognition(detected_frame, detected_face):
+    """
+    Queues a recognition task on a full-resolution frame. In single-stream mode that is the detected
+    frame itself; with dual-stream capture it is a snapshot, in which the preview's box, scaled to the
+    snapshot, only narrows down where the recognition detector looks, since the face may have moved.
+    """
+    def on_full_frame(frame):
+        if frame is None or frame is detected_frame:
+            recognition_task_queue.put((detected_frame, detected_face if REUSE_PREVIEW_DETECTION else None, None))
+        else:
+            region = map_face_to_frame(detected_face, detected_frame, frame) if detected_face is not None else None
+            recognition_task_queue.put((frame, None, region))
+    camera_service.request_snapshot(on_full_frame, detected_frame)
+
+def count_preview_faces(frame, display_size):
+    """
+    Detects faces inside the displayed region of a frame with the preview detector. Runs on the detection thread.
+    Returns (detection_count, best_face): the number of confident faces and the largest of them mapped
+    back to full-frame coordinates (None if there is none), so the tracker and recognition can reuse it.
+    """
+    if preview_detector is None:
+        return 0, None # No preview detector, no faces detected
+
+    label_width, label_height = display_size
+    original_h, original_w, _ = frame.shape
+    crop_x, crop_y, crop_w, crop_h = compute_display_crop(original_w, original_h, label_width, label_height)
+    # The crop is centered, so the unflipped frame holds the same faces as the mirrored preview
+    cropped_frame = frame[crop_y : crop_y + crop_h, crop_x : crop_x + crop_w]
+
+    faces = detect_faces_downscaled(preview_detector, cropped_frame, DETECTION_MAX_SIDE)
+    # Filter faces by confidence and count valid detections
+    detection_count = sum(1 for face_info in faces if face_info['confidence'] >= preview_detector.min_confidence)
+    best_face = select_best_face(faces, preview_detector.min_confidence)
+    if best_face is not None:
+        best_face = offset_face(best_face, crop_x, crop_y)
+    return detection_count, best_face
+
+def start_preview_pipeline(display_size):
+    """
+    Subscribes a camera window to the camera service and starts its detection thread. display_size is
+    updated by the Tk loop. Frames are rendered for display on the capture thread; the Tk loop shows
+    items of camera_service.slot newer than start_seq with renderer.show.
+    Returns (start_seq, detection, renderer), or None if the camera is not available.
+    """
+    renderer = PreviewRenderer(decorate=preview_guide)
+    start_seq = camera_service.subscribe(prepare=lambda frame: renderer.render(frame, display_size))
+    if start_seq is None:
+        return None
+    scheduler = DetectionScheduler(PREVIEW_DETECTION_RATE_HZ, PREVIEW_DETECTION_EVERY_K_FRAMES, PREVIEW_DETECTION_MAX_DUTY_CYCLE, PREVIEW_VERIFY_RATE_HZ)
+    tracker = FaceTracker(DETECTION_MAX_SIDE)
+
+    def detect(frame):
+        detection_count, best_face = count_preview_faces(frame, display_size)
+        if PREVIEW_TRACKING and best_face is not None:
+            # A healthy track slows the following detections down to verification passes
+            scheduler.tracking = tracker.start(frame, best_face)
+        else:
+            tracker.reset()
+            scheduler.tracking = False
+        return detection_count, best_face
+
+    def track(frame):
+        tracked_face, lost = tracker.update(frame)
+        return ((1, tracked_face) if tracked_face is not None else None), lost
+
+    detection = DetectionThread(camera_service.slot, detect, scheduler, track if PREVIEW_TRACKING else None, start_seq, PREVIEW_TRACKING_RATE_HZ)
+    detection.start()
+    return start_seq, detection, renderer
+
+def stop_preview_pipeline(detection, renderer):
+    detection.stop()
+    camera_service.unsubscribe() # Keeps the camera open for the next transaction
+    print(f"Camera preview: {renderer.summary()}")
+
 # === Helper: Open Camera for Recognition (for ADD/GET) ===
 def open_camera_for_recognition(action_type):
     global Pick_ID, recognition_thread, thread_running
@@ -434,19 +666,22 @@ def open_camera_for_recognition(action_type):
     face_status_label = Label(camera_window, text="No Face Detected", font=("Arial", 20, "bold"), fg="red", bg="black")
     face_status_label.place(relx=0.5, rely=0.05, anchor=tk.N)
 
-    cap = cv2.VideoCapture(CAMERA_INDEX)
-    if not cap.isOpened():
+    camera_window.update_idletasks()
+
+    # Frames are read and detected on background threads; the Tk loop below only blits and reacts
+    display_size = [screen_width, screen_height]
+    pipeline = start_preview_pipeline(display_size)
+    if pipeline is None:
         show_temp_toplevel_message("Camera Error", "Cannot access camera. Please check connection.")
         camera_window.destroy()
         return None, None
-
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAMERA_WIDTH)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAMERA_HEIGHT)
-    camera_window.update_idletasks()
+    start_seq, detection, renderer = pipeline
 
     matched_locker_id = None
     is_recognition_in_progress = False 
     closing_scheduled = False 
+    last_frame_seq = start_seq
+    last_detection_seq = 0
 
     def check_recognition_results():
         nonlocal matched_locker_id, is_recognition_in_progress, closing_scheduled
@@ -464,7 +699,7 @@ def open_camera_for_recognition(action_type):
                 
             if not closing_scheduled:
                 closing_scheduled = True
-                camera_window.after(POST_RECOGNITION_CAMERA_DURATION_MS, lambda: [cap.release(), camera_window.destroy()])
+                camera_window.after(POST_RECOGNITION_CAMERA_DURATION_MS, camera_window.destroy)
                 print(f"Camera scheduled to close in {POST_RECOGNITION_CAMERA_DURATION_MS/1000} seconds after recognition.")
             
         except queue.Empty:
@@ -476,54 +711,41 @@ def open_camera_for_recognition(action_type):
     camera_label.after(100, check_recognition_results)
     
     def update_recognition_feed():
-        nonlocal matched_locker_id, closing_scheduled, is_recognition_in_progress 
-        ret, frame = cap.read()
-        if ret:
-            display_frame = cv2.flip(frame, 1)
-
-            label_width = camera_label.winfo_width()
-            label_height = camera_label.winfo_height()
-
-            if label_width <= 1 or label_height <= 1:
-                label_width = screen_width
-                label_height = screen_height
-
-            target_aspect_ratio = label_width / label_height
-            original_h, original_w, _ = display_frame.shape
-            original_aspect_ratio = original_w / original_h
-
-            crop_x, crop_y, crop_w, crop_h = 0, 0, original_w, original_h
-
-            if original_aspect_ratio > target_aspect_ratio:
-                crop_w = int(original_h * target_aspect_ratio)
-                crop_x = (original_w - crop_w) // 2
-            else:
-                crop_h = int(original_w / target_aspect_ratio)
-                crop_y = (original_h - crop_h) // 2
-
-            cropped_display_frame = display_frame[crop_y : crop_y + crop_h, crop_x : crop_x + crop_w]
+        nonlocal matched_locker_id, closing_scheduled, is_recognition_in_progress, last_frame_seq, last_detection_seq
+        if not camera_window.winfo_exists():
+            return
+        if camera_service.failed:
+            show_temp_toplevel_message("Camera Error", "Failed to read frame from camera.")
+            camera_window.destroy()
+            return
 
-            gray = cv2.cvtColor(cropped_display_frame, cv2.COLOR_BGR2GRAY)
-            faces = face_cascade.detectMultiScale(gray, 1.1, 4, minSize=(30, 30))
+        label_width = camera_label.winfo_width()
+        label_height = camera_label.winfo_height()
 
-            detection_count = len(faces) # Simplified detection count to only faces for this refactor
+        if label_width <= 1 or label_height <= 1:
+            label_width = screen_width
+            label_height = screen_height
+        display_size[:] = (label_width, label_height)
 
-            # Calculate border coordinates based on the cropped frame
-            border_w = int(cropped_display_frame.shape[1] * BORDER_WIDTH_RATIO)
-            border_h = int(cropped_display_frame.shape[0] * BORDER_HEIGHT_RATIO)
-            border_x1 = (cropped_display_frame.shape[1] - border_w) // 2
-            border_y1 = (cropped_display_frame.shape[0] - border_h) // 2
-            border_x2 = border_x1 + border_w
-            border_y2 = border_y1 + border_h
+        # Blit the newest prepared frame, if the capture thread produced one since the last tick
+        frame_seq, frame_item = camera_service.slot.get()
+        if frame_seq != last_frame_seq:
+            last_frame_seq = frame_seq
+            renderer.show(camera_label, frame_item[1])
 
-            draw_rounded_corners_with_lines(cropped_display_frame, (border_x1, border_y1), (border_x2, border_y2), BORDER_COLOR, BORDER_THICKNESS, BORDER_RADIUS, SHORT_LINE_LENGTH)
+        # React only to new detection results; the detector runs at its own rate
+        detection_seq, detection_item = detection.slot.get()
+        if detection_seq != last_detection_seq:
+            last_detection_seq = detection_seq
+            detected_frame, (detection_count, detected_face) = detection_item
 
             if detection_count > 0: # Check if any face is detected
                 face_status_label.config(text="Face Detected!", fg="green")
                 
                 if not is_recognition_in_progress and not closing_scheduled:
                     print("Main Thread: Face detected, sending frame to recognition worker.")
-                    recognition_task_queue.put(frame.copy())
+                    # Send a full-resolution frame together with the detection, so the worker can crop directly
+                    request_recognition(detected_frame, detected_face)
                     is_recognition_in_progress = True 
             else: 
                 face_status_label.config(text="No Face Detected", fg="red")
@@ -541,23 +763,12 @@ def open_camera_for_recognition(action_type):
                         except queue.Empty:
                             pass
 
-            cv2_image = cv2.cvtColor(cropped_display_frame, cv2.COLOR_BGR2RGB)
-            pil_image = Image.fromarray(cv2_image)
-            pil_image = pil_image.resize((label_width, label_height), Image.LANCZOS)
-            tk_image = ImageTk.PhotoImage(image=pil_image)
-
-            camera_label.imgtk = tk_image
-            camera_label.config(image=tk_image)
-            
-            if not closing_scheduled:
-                camera_label.after(10, update_recognition_feed)
-        else:
-            show_temp_toplevel_message("Camera Error", "Failed to read frame from camera.")
-            cap.release()
-            camera_window.destroy()
+        if not closing_scheduled:
+            camera_label.after(10, update_recognition_feed)
     camera_label.after(10, update_recognition_feed)
 
     window.wait_window(camera_window)
+    stop_preview_pipeline(detection, renderer)
 
     return matched_locker_id
 
@@ -580,103 +791,106 @@ def open_camera_for_capture(user_folder):
     face_status_label = Label(camera_window, text="No Face Detected", font=("Arial", 20, "bold"), fg="red", bg="black")
     face_status_label.place(relx=0.5, rely=0.05, anchor=tk.N)
 
-    cap = cv2.VideoCapture(CAMERA_INDEX)
-    if not cap.isOpened():
+    camera_window.update_idletasks()
+
+    # Frames are read and detected on background threads; the Tk loop below only blits and reacts
+    display_size = [screen_width, screen_height]
+    pipeline = start_preview_pipeline(display_size)
+    if pipeline is None:
         show_temp_toplevel_message("Camera Error", "Cannot access camera. Please check connection.")
         camera_window.destroy()
         return False
-
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAMERA_WIDTH)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAMERA_HEIGHT)
-    camera_window.update_idletasks()
+    start_seq, detection, renderer = pipeline
 
     captured_images_paths = []
     total_images_to_capture = 8
     captured_count = 0
     start_time_capture = None
     capture_interval = 0.5 
+    snapshot_queue = queue.Queue() # (attempt, frame) for every full-resolution frame the camera service delivers
+    capture_attempt = 0 # Bumped whenever the capture resets, so snapshots of an abandoned attempt are dropped
+    snapshot_pending = False
+    last_frame_seq = start_seq
+    last_detection_seq = 0
 
     def update_camera_feed_send():
-        nonlocal captured_count, start_time_capture
-        ret, frame = cap.read()
-        if ret:
-            display_frame = cv2.flip(frame, 1)
-
-            label_width = camera_label.winfo_width()
-            label_height = camera_label.winfo_height()
-
-            if label_width <= 1 or label_height <= 1:
-                label_width = screen_width
-                label_height = screen_height
-
-            target_aspect_ratio = label_width / label_height
-            original_h, original_w, _ = display_frame.shape
-            original_aspect_ratio = original_w / original_h
-
-            crop_x, crop_y, crop_w, crop_h = 0, 0, original_w, original_h
-
-            if original_aspect_ratio > target_aspect_ratio:
-                crop_w = int(original_h * target_aspect_ratio)
-                crop_x = (original_w - crop_w) // 2
-            else:
-                crop_h = int(original_w / target_aspect_ratio)
-                crop_y = (original_h - crop_h) // 2
-
-            cropped_display_frame = display_frame[crop_y : crop_y + crop_h, crop_x : crop_x + crop_w]
+        nonlocal captured_count, start_time_capture, last_frame_seq, last_detection_seq, capture_attempt, snapshot_pending
+        if not camera_window.winfo_exists():
+            return
+        if camera_service.failed:
+            show_temp_toplevel_message("Camera Error", "Failed to read frame from camera.")
+            camera_window.destroy()
+            return
 
-            gray = cv2.cvtColor(cropped_display_frame, cv2.COLOR_BGR2GRAY)
-            faces = face_cascade.detectMultiScale(gray, 1.1, 4, minSize=(30, 30))
+        label_width = camera_label.winfo_width()
+        label_height = camera_label.winfo_height()
 
-            detection_count = len(faces) # Simplified detection count to only faces
+        if label_width <= 1 or label_height <= 1:
+            label_width = screen_width
+            label_height = screen_height
+        display_size[:] = (label_width, label_height)
 
-            border_w = int(cropped_display_frame.shape[1] * BORDER_WIDTH_RATIO)
-            border_h = int(cropped_display_frame.shape[0] * BORDER_HEIGHT_RATIO)
-            border_x1 = (cropped_display_frame.shape[1] - border_w) // 2
-            border_y1 = (cropped_display_frame.shape[0] - border_h) // 2
-            border_x2 = border_x1 + border_w
-            border_y2 = border_y1 + border_h
+        # Blit the newest prepared frame, if the capture thread produced one since the last tick
+        frame_seq, frame_item = camera_service.slot.get()
+        if frame_seq != last_frame_seq:
+            last_frame_seq = frame_seq
+            renderer.show(camera_label, frame_item[1])
 
-            draw_rounded_corners_with_lines(cropped_display_frame, (border_x1, border_y1), (border_x2, border_y2), BORDER_COLOR, BORDER_THICKNESS, BORDER_RADIUS, SHORT_LINE_LENGTH)
+        # Save full-resolution frames delivered since the last tick
+        while True:
+            try:
+                attempt, snapshot = snapshot_queue.get_nowait()
+            except queue.Empty:
+                break
+            snapshot_pending = False
+            if attempt != capture_attempt or snapshot is None or captured_count >= total_images_to_capture:
+                continue
+            path = os.path.join(user_folder, f"image_{captured_count + 1}.jpg")
+            cv2.imwrite(path, snapshot) # Save the full-resolution frame
+            captured_images_paths.append(path)
+            captured_count += 1
+            print(f"Saved image: {path}")
+
+        # React only to new detection results; the detector runs at its own rate
+        detection_seq, detection_item = detection.slot.get()
+        if detection_seq != last_detection_seq:
+            last_detection_seq = detection_seq
+            detected_frame, (detection_count, _) = detection_item
 
             if detection_count > 0:
                 face_status_label.config(text="Face Detected!", fg="green")
             else:
                 face_status_label.config(text="No Face Detected", fg="red")
 
-            cv2_image = cv2.cvtColor(cropped_display_frame, cv2.COLOR_BGR2RGB)
-            pil_image = Image.fromarray(cv2_image)
-
-            pil_image = pil_image.resize((label_width, label_height), Image.LANCZOS)
-            tk_image = ImageTk.PhotoImage(pil_image)
-
-            camera_label.imgtk = tk_image
-            camera_label.config(image=tk_image)
-
             if detection_count > 0 and captured_count < total_images_to_capture:
                 if start_time_capture is None:
                     start_time_capture = time.time()
+                    # Stay at snapshot resolution for the whole burst instead of switching for every image
+                    camera_service.hold_snapshot_resolution(True)
                     print("Face detected, starting image capture timer.")
 
-                if (time.time() - start_time_capture) >= (capture_interval * captured_count):
-                    path = os.path.join(user_folder, f"image_{captured_count + 1}.jpg")
-                    cv2.imwrite(path, frame)
-                    captured_images_paths.append(path)
-                    captured_count += 1
-                    print(f"Saved image: {path}")
+                if not snapshot_pending and (time.time() - start_time_capture) >= (capture_interval * captured_count):
+                    # The frame the face was detected on, or a full-resolution snapshot with dual-stream capture
+                    snapshot_pending = True
+                    camera_service.request_snapshot(lambda frame, attempt=capture_attempt: snapshot_queue.put((attempt, frame)), detected_frame)
             elif detection_count == 0 and start_time_capture is not None:
                 start_time_capture = None
                 captured_count = 0
                 captured_images_paths.clear()
+                capture_attempt += 1
+                snapshot_pending = False
+                camera_service.hold_snapshot_resolution(False)
                 print("Face lost, resetting image capture.")
 
         if captured_count < total_images_to_capture:
             camera_label.after(10, update_camera_feed_send)
         else:
-            cap.release()
             camera_window.destroy()
     
     camera_label.after(10, update_camera_feed_send)
     window.wait_window(camera_window)
+    camera_service.hold_snapshot_resolution(False)
+    stop_preview_pipeline(detection, renderer)
     
     return len(captured_images_paths) > 0 # Return True if images were captured, False otherwise
 
@@ -723,14 +937,8 @@ def handle_locker_completion(locker_id, user_folder_path, action_type):
             final_locker_status_available = input_devices[locker_id].value 
             if not final_locker_status_available:
                 if action_type == 'send':
-                    show_temp_toplevel_message("Training", "Training ...")
-                    try:
-                        subprocess.run(["python", "train.py"], check=True)
-                        show_temp_toplevel_message("Training", "Training completed.")
-                    except FileNotFoundError:
-                        show_temp_toplevel_message("Error", "Could not find 'train.py' file for retraining.")
-                    except Exception as e:
-                        show_temp_toplevel_message("Training Error", f"Error running 'train.py' during retraining: {e}")
+                    # Queued on the background training thread; the next user can start right away
+                    training_jobs.submit(JOB_ENROLL, os.path.basename(user_folder_path))
                 elif action_type in ['get', 'add']:
                     show_temp_toplevel_message("Locker Status", "Locker is still in use.")
                     
@@ -742,14 +950,13 @@ def handle_locker_completion(locker_id, user_folder_path, action_type):
                 else:
                     print(f"Locker folder not found: {user_folder_path}")
                     
-                show_temp_toplevel_message("Training", "Retraining ...")
-                try:
-                    subprocess.run(["python", "train.py"], check=True)
-                    show_temp_toplevel_message("Training", "Retraining completed.")
-                except FileNotFoundError:
-                    show_temp_toplevel_message("Error", "Could not find 'train.py' file for retraining.")
-                except Exception as e:
-                    show_temp_toplevel_message("Training Error", f"Error running 'train.py' during retraining: {e}")
+                # Drop only this locker's embeddings right away (a header rewrite), so the previous occupant
+                # can no longer open it, even if a new SEND reuses this locker folder before training catches up
+                locker_name = os.path.basename(user_folder_path)
+                remove_locker_embeddings(EMBEDDINGS_FILE, locker_name)
+                if training_jobs.has_job(locker_name):
+                    # A queued or running enrollment of this locker would merge them back; remove again after it
+                    training_jobs.submit(JOB_REMOVE, locker_name)
         except KeyError:
             show_temp_toplevel_message("GPIO Error", f"Input GPIO pin not found for locker {locker_id}.")
         except Exception as e:
@@ -757,8 +964,42 @@ def handle_locker_completion(locker_id, user_folder_path, action_type):
     update_pick_id_status()
     update_available_display()
 
+# === Wait for the Face Models Without Blocking the UI ===
+pending_model_action = None
+
+def run_when_models_ready(action):
+    """
+    Runs a button action now if the face models have finished loading, otherwise remembers it
+    (the latest press wins) and lets poll_model_engine() run it once they have.
+    Returns True if the action was deferred.
+    """
+    global pending_model_action
+    if model_engine.is_finished:
+        return False
+    pending_model_action = action
+    model_status_var.set(f"Starting up: {model_engine.stage} ... please wait.")
+    return True
+
+def poll_model_engine():
+    """Shows the loading stage in the footer until the models are ready, then runs any deferred action."""
+    global pending_model_action
+    if not model_engine.is_finished:
+        if pending_model_action is not None:
+            model_status_var.set(f"Starting up: {model_engine.stage} ... please wait.")
+        window.after(200, poll_model_engine)
+        return
+    if model_engine.is_ready:
+        model_status_var.set("")
+    else:
+        model_status_var.set("Face models failed to load.")
+    action, pending_model_action = pending_model_action, None
+    if action is not None:
+        action()
+
 # === Refactored SEND Function ===
 def send_button():
+    if run_when_models_ready(send_button):
+        return
     update_pick_id_status()
     locker_to_open_index = Pick_ID[0]
 
@@ -789,6 +1030,8 @@ def send_button():
 
 # === Refactored GET Function ===
 def get_button():
+    if run_when_models_ready(get_button):
+        return
     matched_locker_id = open_camera_for_recognition('get')
 
     if matched_locker_id is None:
@@ -810,6 +1053,8 @@ def get_button():
 
 # === Refactored ADD Function ===
 def add_button():
+    if run_when_models_ready(add_button):
+        return
     matched_locker_id = open_camera_for_recognition('add')
 
     if matched_locker_id is None:
@@ -872,8 +1117,23 @@ create_image_button(100, 700, "picture/BUTTON/GET_1.png", "picture/BUTTON/GET_2.
 # === Footer ===
 footer = tk.Frame(window, bg="#FFFFFF", pady=8)
 footer.pack(fill="x", side="bottom")
+model_status_var = tk.StringVar(value="")
+tk.Label(footer, textvariable=model_status_var, font=small_font, fg="#191970", bg="#FFFFFF").pack()
+training_status_var = tk.StringVar(value="")
+tk.Label(footer, textvariable=training_status_var, font=small_font, fg="#191970", bg="#FFFFFF").pack()
 tk.Label(footer, text="Pham Lu Huy Chuong - 2188201100\nTran Minh Thien - 2188200439", font=small_font, fg="#666666", bg="#FFFFFF", justify="center").pack()
 
+# === Start Background Training Jobs ===
+training_jobs.start()
+# Open the camera now, so the first transaction does not wait for it; in the background, so the window shows first
+def start_camera_service():
+    if not camera_service.start():
+        print("Warning: Camera not available at startup; it will be opened again when a camera window needs it.")
+
+threading.Thread(target=start_camera_service, daemon=True).start()
+poll_training_events()
+poll_model_engine()
+
 # === Handle Window Closing ===
 def on_closing():
     global thread_running, recognition_thread 
@@ -886,6 +1146,9 @@ def on_closing():
         recognition_thread.join(timeout=5) 
         if recognition_thread.is_alive():
             print("Warning: Recognition thread did not terminate gracefully.")
+
+    training_jobs.stop()
+    camera_service.stop()
     
     if GPIO_AVAILABLE:
         for device in input_devices.values():